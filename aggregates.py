@@ -0,0 +1,136 @@
+"""Parallel, incremental build of the dashboard aggregates.
+
+Every aggregate the sections chart from is registered in `AGGREGATES` with the
+store columns it needs and how to merge its per-partition results. All of
+them merge exactly (counts and sums, and a sample ranked by flight hashes), so
+each partition's aggregates are built on their own, pickled next to its store,
+and merged on load. Appending a day of flights then only builds that day's
+aggregates, and `extend_aggregates` merges them into the history's.
+
+`build_aggregates` fans the missing (aggregate, partition) builds out over a
+process pool; each worker memory-maps only its own columns from the typed
+store, so nothing but the small results crosses process boundaries.
+
+Ingest new partitions and build their aggregates ahead of the app with:
+
+    python aggregates.py SOURCE
+"""
+import glob
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pyarrow.feather as feather
+
+from flight_data import (
+    DELAY_CAUSES, DELAY_TYPES, FLIGHT_KEY_COLUMNS, carrier_delay_counts, carrier_sample, daily_delay_totals,
+    daily_status_counts, delay_bin_pairs, dep_arr_cells, distance_delay_cells, merge_carrier_samples,
+    merge_counts, merge_daily_totals, merge_route_delays, merge_status_cubes, on_time_counts,
+    route_delay_counts, status_cube,
+)
+from flight_store import CACHE_DIR, read_stores, store_paths, tmp_path
+
+# name -> (builder taking a DataFrame, store columns it reads, merge of per-partition results)
+AGGREGATES = {
+    'overview': (on_time_counts, ['ON_TIME?'], partial(merge_counts, keys=['ON_TIME?'])),
+    'status_cube': (status_cube, ['FL_DATE', 'OP_CARRIER', 'ORIGIN', 'DEST', 'STATUS'], merge_status_cubes),
+    'carrier_delay': (carrier_delay_counts, ['OP_CARRIER', 'CARRIER_DELAY'],
+                      partial(merge_counts, keys=['OP_CARRIER', 'CARRIER_DELAY'])),
+    'daily_delays': (daily_delay_totals, ['FL_DATE'] + DELAY_CAUSES, merge_daily_totals),
+    'daily_status': (daily_status_counts, ['FL_DATE', 'STATUS'], merge_daily_totals),
+    'delay_bins': (delay_bin_pairs, DELAY_TYPES, partial(merge_counts, keys=['src', 'src_bin', 'dst', 'dst_bin'])),
+    'dep_arr_cells': (dep_arr_cells, ['CRS_DEP_TIME', 'CRS_ARR_TIME', 'STATUS', 'ARR_DELAY'],
+                      partial(merge_counts, keys=['CRS_DEP_TIME', 'CRS_ARR_TIME', 'STATUS'])),
+    'distance_delay_cells': (distance_delay_cells, ['DISTANCE', 'LATE_AIRCRAFT_DELAY'],
+                             partial(merge_counts, keys=['DISTANCE', 'LATE_AIRCRAFT_DELAY'])),
+    'route_delays': (route_delay_counts, ['ORIGIN', 'DEST'] + DELAY_TYPES, merge_route_delays),
+    'carrier_sample': (carrier_sample, FLIGHT_KEY_COLUMNS + DELAY_TYPES, merge_carrier_samples),
+}
+# Bump whenever a builder changes, to invalidate previously saved results
+AGGREGATE_VERSION = 3
+# Below this many rows the pool start-up costs more than it saves
+PARALLEL_MIN_ROWS = 1_000_000
+
+
+def aggregate_path(path, name):
+    """Where the `name` aggregate of the single store at `path` is saved."""
+    store = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, 'aggregates', f'{store}-{name}-v{AGGREGATE_VERSION}.pkl')
+
+
+def prune_aggregates():
+    """Delete the saved aggregates of stores that are gone, and of other versions or names."""
+    stores = glob.glob(os.path.join(CACHE_DIR, '*.feather'))
+    current = {aggregate_path(store, name) for store in stores for name in AGGREGATES}
+    for path in glob.glob(os.path.join(CACHE_DIR, 'aggregates', '*.pkl')):
+        if path not in current:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def build_aggregate(name, paths):
+    func, columns, _ = AGGREGATES[name]
+    return func(read_stores(paths, columns))
+
+
+def merge_aggregate(name, results):
+    return AGGREGATES[name][2](results)
+
+
+def _save(result, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # The app and `python aggregates.py` may save the same aggregate at once
+    tmp = tmp_path(path)
+    with open(tmp, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def build_aggregates(paths, names=None, max_workers=None):
+    """Return {name: aggregate} over the stores at `paths`.
+
+    Each store's aggregates are loaded from disk when saved before, the missing
+    ones are built (in parallel when worthwhile) and saved, and the results of
+    all stores are merged.
+    """
+    names = list(AGGREGATES) if names is None else names
+    results = {}
+    missing = []
+    for path in paths:
+        for name in names:
+            saved = aggregate_path(path, name)
+            if os.path.exists(saved):
+                with open(saved, 'rb') as f:
+                    results[name, path] = pickle.load(f)
+            else:
+                missing.append((name, path))
+
+    new_paths = {path for _, path in missing}
+    rows = sum(feather.read_table(p, columns=[], memory_map=True).num_rows for p in new_paths)
+    if len(missing) > 1 and rows >= PARALLEL_MIN_ROWS and max_workers != 1:
+        workers = min(len(missing), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(build_aggregate, key[0], [key[1]]) for key in missing}
+            built = {key: future.result() for key, future in futures.items()}
+    else:
+        built = {(name, path): build_aggregate(name, [path]) for name, path in missing}
+
+    for (name, path), result in built.items():
+        _save(result, aggregate_path(path, name))
+    prune_aggregates()
+    results.update(built)
+    return {name: merge_aggregate(name, [results[name, path] for path in paths]) for name in names}
+
+
+def extend_aggregates(aggregates, paths):
+    """`aggregates` of some stores merged with those of the other stores at `paths`."""
+    added = build_aggregates(paths, names=list(aggregates))
+    return {name: merge_aggregate(name, [aggregates[name], added[name]]) for name in aggregates}
+
+
+if __name__ == '__main__':
+    build_aggregates(store_paths(sys.argv[1]))
@@ -0,0 +1,204 @@
+"""Local, pre-projected and simplified US states basemap for the route maps.
+
+The maps used to fetch us-10m.json from vega.github.io and project it with
+albersUsa in the browser on every render. `build_basemap` decodes a local copy
+of that TopoJSON once, projects it with the same albersUsa composite (lower
+48, Alaska and Hawaii insets), simplifies the shared arcs and writes one small
+GeoJSON file per level of LEVELS to data/. The app charts that file with
+Vega-Lite's identity projection, and places the airports with `albers_usa` so
+that they line up with the states.
+
+The file in data/ was built from the US states TopoJSON that bqplot ships
+(bqplot/map_data/USStatesMap.json, from Natural Earth) with:
+
+    python basemap.py path/to/USStatesMap.json subunits
+
+A copy of vega-datasets' us-10m.json works the same way (its object is `states`,
+the default).
+"""
+import functools
+import json
+import os
+import sys
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+REMOTE_TOPOJSON = 'https://vega.github.io/vega-datasets/data/us-10m.json'
+
+# Douglas-Peucker tolerance, in pixels at SCALE, of each simplification level
+# built; the maps draw only DEFAULT_LEVEL, so it is the only one shipped
+LEVELS = {'medium': 0.6}
+DEFAULT_LEVEL = 'medium'
+
+# d3.geoAlbersUsa defaults
+SCALE = 1070
+TRANSLATE = (480, 250)
+# d3 clips the lower 48 (which contains the insets) to this extent, x0, y0, x1, y1
+EXTENT = (TRANSLATE[0] - 0.455 * SCALE, TRANSLATE[1] - 0.238 * SCALE,
+          TRANSLATE[0] + 0.455 * SCALE, TRANSLATE[1] + 0.238 * SCALE)
+
+
+def basemap_path(level):
+    return os.path.join(DATA_DIR, f'us-states-{level}.json')
+
+
+def _conic_equal_area(parallels, rotate, center):
+    """Albers equal-area conic as in d3.geoConicEqualArea.
+
+    `rotate` is the longitude rotation and `center` is given in rotated coordinates.
+    """
+    phi0, phi1 = np.radians(parallels)
+    sy0 = np.sin(phi0)
+    n = (sy0 + np.sin(phi1)) / 2
+    c = 1 + sy0 * (2 * n - sy0)
+    r0 = np.sqrt(c) / n
+
+    def raw(lon, lat):
+        lam = np.radians(lon + rotate)
+        r = np.sqrt(np.maximum(c - 2 * n * np.sin(np.radians(lat)), 0)) / n
+        return r * np.sin(lam * n), r0 - r * np.cos(lam * n)
+
+    cx, cy = raw(np.float64(center[0] - rotate), np.float64(center[1]))
+    return lambda lon, lat: tuple(v - c0 for v, c0 in zip(raw(lon, lat), (cx, cy)))
+
+
+_LOWER48 = _conic_equal_area((29.5, 45.5), 96, (-0.6, 38.7))
+_ALASKA = _conic_equal_area((55, 65), 154, (-2, 58.5))
+_HAWAII = _conic_equal_area((8, 18), 157, (-3, 19.9))
+
+
+def albers_usa(lon, lat):
+    """Project longitudes/latitudes to albersUsa screen coordinates (y pointing down)."""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    alaska = (lat > 50) & ((lon < -129) | (lon > 170))
+    hawaii = (lat < 30) & (lon < -150)
+
+    x, y = _LOWER48(lon, lat)
+    ax, ay = _ALASKA(np.where(lon > 0, lon - 360, lon), lat)
+    hx, hy = _HAWAII(lon, lat)
+    # The insets' scale and offsets relative to the lower 48, as in d3
+    x = np.select([alaska, hawaii], [0.35 * ax - 0.307, hx - 0.205], x)
+    y = np.select([alaska, hawaii], [0.35 * ay - 0.201, hy - 0.212], y)
+    return TRANSLATE[0] + SCALE * x, TRANSLATE[1] - SCALE * y
+
+
+def project_airports(index):
+    """Airport index with longitude/latitude replaced by albersUsa x/y, for the identity projection."""
+    x, y = albers_usa(index['longitude'], index['latitude'])
+    return index.assign(longitude=x, latitude=y)
+
+
+def _decode_arcs(topology):
+    scale = topology['transform']['scale']
+    translate = topology['transform']['translate']
+    arcs = []
+    for arc in topology['arcs']:
+        points = np.cumsum(np.asarray(arc, dtype=np.float64), axis=0)
+        arcs.append(points * scale + translate)
+    return arcs
+
+
+def _simplify(points, tolerance):
+    """Douglas-Peucker simplification of a polyline, always keeping its end points."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(*segment)
+        if length == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(dist))
+        if dist[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack.extend([(first, middle), (middle, last)])
+    return points[keep]
+
+
+def _ring(arcs, indexes):
+    points = []
+    for i in indexes:
+        arc = arcs[i] if i >= 0 else arcs[~i][::-1]
+        # Consecutive arcs share their joining point
+        points.extend(arc[1:] if points else arc)
+    return points
+
+
+def _in_extent(ring):
+    points = np.asarray(ring)
+    return bool(np.any((points[:, 0] >= EXTENT[0]) & (points[:, 1] >= EXTENT[1])
+                       & (points[:, 0] <= EXTENT[2]) & (points[:, 1] <= EXTENT[3])))
+
+
+def _polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['arcs']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['arcs']
+    return []
+
+
+def build_basemap(topojson_path, object_name='states', levels=LEVELS, out_dir=DATA_DIR):
+    """Write one projected, simplified GeoJSON file of the states per level.
+
+    `object_name` is the TopoJSON object holding the states. Polygons that
+    albersUsa clips away entirely (e.g. Puerto Rico) are left out.
+    """
+    with open(topojson_path) as f:
+        topology = json.load(f)
+
+    projected = []
+    for arc in _decode_arcs(topology):
+        x, y = albers_usa(arc[:, 0], arc[:, 1])
+        projected.append(np.column_stack([x, y]))
+    states = topology['objects'][object_name]['geometries']
+
+    os.makedirs(out_dir, exist_ok=True)
+    for level, tolerance in levels.items():
+        # Simplifying the shared arcs once keeps neighbouring states seamless
+        arcs = [np.round(_simplify(arc, tolerance), 1).tolist() for arc in projected]
+        features = []
+        for state in states:
+            polygons = []
+            for polygon in _polygons(state):
+                rings = [_ring(arcs, ring) for ring in polygon]
+                rings = [ring for ring in rings if len(ring) >= 4]
+                if rings and _in_extent(rings[0]):
+                    polygons.append(rings)
+            if polygons:
+                features.append({
+                    'type': 'Feature',
+                    'id': state.get('id'),
+                    'properties': {},
+                    'geometry': {'type': 'MultiPolygon', 'coordinates': polygons},
+                })
+        with open(os.path.join(out_dir, f'us-states-{level}.json'), 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f, separators=(',', ':'))
+
+
+@functools.lru_cache(maxsize=None)
+def load_basemap(level=DEFAULT_LEVEL):
+    """The pre-projected states of `level`, or None when they haven't been built.
+
+    Loaded once per process. Separate Streamlit charts can't share data, so
+    each map's spec still embeds its own copy (about 85 KB at `medium`).
+    """
+    path = basemap_path(level)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['features']
+
+
+if __name__ == '__main__':
+    build_basemap(*sys.argv[1:3])
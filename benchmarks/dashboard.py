@@ -0,0 +1,154 @@
+"""Headless benchmark of the whole dashboard over synthetic datasets.
+
+For every size it writes a synthetic flight CSV once (see synthetic.py), then
+times the store ingest, the load, the status classification, each registered
+aggregate and each section's chart spec build, all without Streamlit or a
+browser. Every step records its wall time, peak traced memory and spec bytes
+with `profiling.Profiler`. The results are saved as JSON labelled with the git
+commit, so runs of different commits can be diffed. Run from the repo root:
+
+    python -m benchmarks.dashboard [--rows ROWS ...] [--seed SEED] [--no-memory] [--out PATH]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+
+import altair as alt
+import pandas as pd
+
+import charts
+from aggregates import AGGREGATES, build_aggregate
+from basemap import load_basemap, project_airports
+from benchmarks.synthetic import GENERATOR_VERSION, write_flights
+from flight_data import airport_index, classify_status
+from flight_store import CACHE_DIR, STORE_VERSION, ingest_csv, read_stores
+from profiling import Profiler
+from route_index import RouteIndex
+
+BENCH_DIR = os.path.join(CACHE_DIR, 'benchmarks')
+SIZES = [5_000, 500_000, 5_000_000]
+
+# name -> builder taking (df, aggregates, airports, basemap)
+CHARTS = {
+    'delay_per': lambda df, agg, airports, basemap: charts.delay_overview(agg['overview']),
+    'delay_distribution': lambda df, agg, airports, basemap: charts.delay_distribution(agg['delay_bins']),
+    'status_by_option': lambda df, agg, airports, basemap: charts.status_by_option(agg['status_cube'], 'MONTH'),
+    'plot_map ORIGIN': lambda df, agg, airports, basemap: charts.route_map(
+        agg['route_index'], airports, basemap, -100, 1000, 'ORIGIN', 'DEST'),
+    'plot_map DEST': lambda df, agg, airports, basemap: charts.route_map(
+        agg['route_index'], airports, basemap, -100, 1000, 'DEST', 'ORIGIN'),
+    'carrier_delay': lambda df, agg, airports, basemap: charts.carrier_delay_bars(agg['carrier_delay']),
+    'carrier_delay_points': lambda df, agg, airports, basemap: charts.carrier_delay_points(
+        agg['carrier_sample'], 'ARR_DELAY'),
+    'status_by_dep_arr': lambda df, agg, airports, basemap: charts.status_by_dep_arr(
+        df, agg['dep_arr_cells']),
+    'delay_by_month_date': lambda df, agg, airports, basemap: charts.delay_by_month_date(
+        agg['daily_delays'], 'Month'),
+    'late_aircraft_delay_by_distance': lambda df, agg, airports, basemap: charts.late_aircraft_delay_by_distance(
+        df, agg['distance_delay_cells']),
+}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def synthetic_csv(rows, seed):
+    path = os.path.join(BENCH_DIR, f'synthetic-{rows}-s{seed}-g{GENERATOR_VERSION}.csv')
+    # Files of this dataset from older generators are never read again
+    for old in glob.glob(os.path.join(BENCH_DIR, f'synthetic-{rows}-s{seed}*.csv')):
+        if old != path:
+            os.remove(old)
+    if not os.path.exists(path):
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        write_flights(rows, path + '.tmp', seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def run_size(rows, seed, trace_memory=True):
+    """Profile every dashboard step over `rows` synthetic flights; returns the step records."""
+    profiler = Profiler(enabled=True, trace_memory=trace_memory)
+    csv_path = synthetic_csv(rows, seed)
+    store = os.path.join(BENCH_DIR, f'synthetic-{rows}-s{seed}-v{STORE_VERSION}.feather')
+    # Stores of this dataset from older store versions are never read again
+    for old in glob.glob(os.path.join(BENCH_DIR, f'synthetic-{rows}-s{seed}-v*.feather')):
+        if old != store:
+            os.remove(old)
+
+    with profiler.section('ingest'):
+        ingest_csv(csv_path, store)
+    with profiler.section('load'):
+        df = read_stores([store])
+    with profiler.section('classify'):
+        classify_status(df)
+
+    aggregates = {}
+    for name in AGGREGATES:
+        with profiler.section(f'aggregate:{name}'):
+            aggregates[name] = build_aggregate(name, [store])
+
+    with profiler.section('route_index'):
+        aggregates['route_index'] = RouteIndex(aggregates['route_delays']['ARR_DELAY'], 'ARR_DELAY')
+
+    basemap = load_basemap()
+    with profiler.section('airport_index'):
+        airports = airport_index(pd.read_csv('airport.csv'), df)
+        if basemap is not None:
+            airports = project_airports(airports)
+
+    for name, build in CHARTS.items():
+        with profiler.section(f'chart:{name}'):
+            profiler.add_spec(build(df, aggregates, airports, basemap).to_dict())
+    return profiler.records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, for undisturbed timings')
+    parser.add_argument('--out', help='result JSON path (default: under .cache/benchmarks)')
+    args = parser.parse_args(argv)
+
+    # As in the app, whose charts embed bounded data that may exceed Altair's row limit
+    alt.data_transformers.disable_max_rows()
+    commit, dirty = git_commit()
+    results = []
+    for rows in args.rows:
+        steps = run_size(rows, args.seed, trace_memory=not args.no_memory)
+        results.append({'rows': rows, 'steps': steps})
+        print(f'{rows:,} flights')
+        for step in steps:
+            print(f"  {step['section']:<40} {step['seconds']:>9.3f}s {step['peak_bytes'] / 2**20:>9.1f} MiB"
+                  f" {step['spec_bytes'] / 2**10:>9.1f} KiB")
+
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'trace_memory': not args.no_memory,
+        'results': results,
+    }
+    out = args.out or os.path.join(BENCH_DIR, f"dashboard-{(commit or 'unknown')[:12]}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'wrote {out}')
+
+
+if __name__ == '__main__':
+    main()
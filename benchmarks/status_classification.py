@@ -0,0 +1,63 @@
+"""Micro-benchmark of the STATUS / ON_TIME? classification.
+
+Compares the vectorized `classify_status` against the original chain of
+`.loc` writes on frames resampled from 2018-5k.csv. Run from the repo root:
+
+    python -m benchmarks.status_classification [ROWS ...]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from flight_data import classify_status
+
+SIZES = [5_000, 1_000_000, 10_000_000]
+
+
+def legacy_status_columns(df):
+    df.loc[df['ARR_DELAY'] <= 0, 'STATUS'] = 'on time'
+    df.loc[df['ARR_DELAY'] > 0, 'STATUS'] = 'slightly delayed'
+    df.loc[df['ARR_DELAY'] >= 30, 'STATUS'] = 'delayed'
+    df.loc[df['DIVERTED'] == 1, 'STATUS'] = 'diverted'
+    df.loc[df['CANCELLED'] == 1, 'STATUS'] = 'cancelled'
+
+    df.loc[df['ARR_DELAY'] <= 0, 'ON_TIME?'] = 'On Time'
+    df.loc[df['ARR_DELAY'] > 0, 'ON_TIME?'] = 'Delayed'
+    df.loc[df['DIVERTED'] == 1, 'ON_TIME?'] = 'Delayed'
+    df.loc[df['CANCELLED'] == 1, 'ON_TIME?'] = 'Delayed'
+    return df
+
+
+def sample_flights(rows, seed=0):
+    sample = pd.read_csv('2018-5k.csv', usecols=['ARR_DELAY', 'CANCELLED', 'DIVERTED']).fillna(0)
+    picks = np.random.default_rng(seed).integers(0, len(sample), rows)
+    return sample.iloc[picks].reset_index(drop=True)
+
+
+def best_of(func, make_input, repeat):
+    times = []
+    for _ in range(repeat):
+        df = make_input()
+        start = time.perf_counter()
+        result = func(df)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main(sizes):
+    print(f"{'rows':>12} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for rows in sizes:
+        flights = sample_flights(rows)
+        repeat = 5 if rows <= 1_000_000 else 1
+        legacy_time, legacy = best_of(legacy_status_columns, flights.copy, repeat)
+        new_time, (status, on_time) = best_of(classify_status, lambda: flights, repeat)
+
+        assert (legacy['STATUS'].to_numpy() == np.asarray(status)).all()
+        assert (legacy['ON_TIME?'].to_numpy() == np.asarray(on_time)).all()
+        print(f'{rows:>12,} {legacy_time:>12.4f} {new_time:>15.4f} {legacy_time / new_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or SIZES)
@@ -0,0 +1,152 @@
+"""Synthetic BTS-shaped flight CSVs of any size.
+
+Carrier and route frequencies follow the skew of 2018-5k.csv, so the flights
+use only its routes (origin and destination drawn independently would spread
+them over some twenty times as many). Distances are the great-circle distances
+between the airports in airport.csv, and delays mix a tight on-time mode with
+a long exponential tail, split into their causes for flights arriving 15 or
+more minutes late, as BTS does. A fixed seed always produces the same file.
+Write one from the repo root with:
+
+    python -m benchmarks.synthetic ROWS OUT.csv [SEED]
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+from flight_data import DELAY_CAUSES
+from flight_store import COLUMNS
+
+SAMPLE_CSV = '2018-5k.csv'
+AIRPORTS_CSV = 'airport.csv'
+YEAR = 2018
+CHUNK_ROWS = 1_000_000
+# Bump whenever the generated flights change, so that cached files are rewritten
+GENERATOR_VERSION = 2
+
+CANCELLED_RATE = 0.015
+DIVERTED_RATE = 0.002
+CANCELLATION_CODES = ['A', 'B', 'C', 'D']
+CANCELLATION_WEIGHTS = [0.3, 0.45, 0.24, 0.01]
+# Share of a delay attributed to each of DELAY_CAUSES, on average
+CAUSE_WEIGHTS = [0.3, 0.05, 0.25, 0.01, 0.39]
+
+
+def _frequencies(values):
+    counts = values.value_counts()
+    return counts.index.to_numpy(), (counts / counts.sum()).to_numpy()
+
+
+def _hhmm(minutes):
+    minutes = np.mod(minutes, 24 * 60)
+    return (minutes // 60) * 100 + minutes % 60
+
+
+def _great_circle_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 3958.8 * 2 * np.arcsin(np.sqrt(a))
+
+
+class FlightGenerator:
+    def __init__(self, seed=0):
+        sample = pd.read_csv(SAMPLE_CSV, usecols=['OP_CARRIER', 'ORIGIN', 'DEST'])
+        coords = pd.read_csv(AIRPORTS_CSV).set_index('iata')[['latitude', 'longitude']]
+        self.carriers, self.carrier_p = _frequencies(sample['OP_CARRIER'])
+        mapped = sample['ORIGIN'].isin(coords.index) & sample['DEST'].isin(coords.index)
+        routes = sample[mapped & (sample['ORIGIN'] != sample['DEST'])].groupby(['ORIGIN', 'DEST']).size()
+        origins, dests = (routes.index.get_level_values(end).to_numpy() for end in ['ORIGIN', 'DEST'])
+        self.airports = np.union1d(origins, dests)
+        # (origin, destination) positions in self.airports of each route
+        self.routes = np.column_stack([np.searchsorted(self.airports, origins),
+                                       np.searchsorted(self.airports, dests)])
+        self.route_p = (routes / routes.sum()).to_numpy()
+        self.coords = coords.loc[self.airports].to_numpy()
+        self.seed = seed
+
+    def chunk(self, rows, index):
+        """The `index`-th chunk of `rows` flights; the same (seed, index) gives the same rows."""
+        rng = np.random.default_rng([self.seed, index])
+
+        origin, dest = self.routes[rng.choice(len(self.routes), rows, p=self.route_p)].T
+        distance = _great_circle_miles(*self.coords[origin].T, *self.coords[dest].T)
+        distance = np.maximum(distance, 30).round()
+
+        days = rng.integers(0, 365, rows)
+        dates = (np.datetime64(f'{YEAR}-01-01') + days).astype(str)
+        crs_dep = rng.integers(5 * 60, 23 * 60, rows)
+        crs_elapsed = (distance / 8 + 30 + rng.normal(0, 5, rows)).round()
+
+        late = rng.random(rows) < 0.2
+        dep_delay = np.where(late, rng.exponential(45, rows), rng.normal(-3, 5, rows))
+        dep_delay = np.maximum(dep_delay, -30).round()
+        taxi_out = np.maximum(rng.gamma(4, 4, rows), 3).round()
+        taxi_in = np.maximum(rng.gamma(2, 4, rows), 1).round()
+        arr_delay = (dep_delay + rng.normal(-5, 8, rows)).round()
+        actual_elapsed = crs_elapsed + arr_delay - dep_delay
+        air_time = np.maximum(actual_elapsed - taxi_out - taxi_in, 10)
+
+        dep_time = _hhmm(crs_dep + dep_delay)
+        wheels_off = _hhmm(crs_dep + dep_delay + taxi_out)
+        wheels_on = _hhmm(crs_dep + dep_delay + taxi_out + air_time)
+        arr_time = _hhmm(crs_dep + crs_elapsed + arr_delay)
+
+        flights = pd.DataFrame({
+            'FL_DATE': dates,
+            'OP_CARRIER': rng.choice(self.carriers, rows, p=self.carrier_p),
+            'OP_CARRIER_FL_NUM': rng.integers(1, 7500, rows),
+            'ORIGIN': self.airports[origin],
+            'DEST': self.airports[dest],
+            'CRS_DEP_TIME': _hhmm(crs_dep),
+            'DEP_TIME': dep_time,
+            'DEP_DELAY': dep_delay,
+            'TAXI_OUT': taxi_out,
+            'WHEELS_OFF': wheels_off,
+            'WHEELS_ON': wheels_on,
+            'TAXI_IN': taxi_in,
+            'CRS_ARR_TIME': _hhmm(crs_dep + crs_elapsed),
+            'ARR_TIME': arr_time,
+            'ARR_DELAY': arr_delay,
+            'CANCELLED': 0.0,
+            'CANCELLATION_CODE': None,
+            'DIVERTED': 0.0,
+            'CRS_ELAPSED_TIME': crs_elapsed,
+            'ACTUAL_ELAPSED_TIME': actual_elapsed,
+            'AIR_TIME': air_time,
+            'DISTANCE': distance,
+        })
+
+        # BTS only attributes causes to arrivals 15 or more minutes late
+        caused = arr_delay >= 15
+        shares = rng.dirichlet(np.asarray(CAUSE_WEIGHTS) * 2, rows)
+        for cause, share in zip(DELAY_CAUSES, shares.T):
+            flights[cause] = np.where(caused, (share * arr_delay).round(), np.nan)
+
+        diverted = rng.random(rows) < DIVERTED_RATE
+        flights.loc[diverted, 'DIVERTED'] = 1.0
+        flights.loc[diverted, ['WHEELS_ON', 'TAXI_IN', 'ARR_TIME', 'ARR_DELAY',
+                               'ACTUAL_ELAPSED_TIME', 'AIR_TIME'] + DELAY_CAUSES] = np.nan
+
+        cancelled = rng.random(rows) < CANCELLED_RATE
+        flights.loc[cancelled, 'CANCELLED'] = 1.0
+        flights.loc[cancelled, 'DIVERTED'] = 0.0
+        flights.loc[cancelled, 'CANCELLATION_CODE'] = rng.choice(
+            CANCELLATION_CODES, cancelled.sum(), p=CANCELLATION_WEIGHTS)
+        flights.loc[cancelled, ['DEP_TIME', 'DEP_DELAY', 'TAXI_OUT', 'WHEELS_OFF', 'WHEELS_ON',
+                                'TAXI_IN', 'ARR_TIME', 'ARR_DELAY', 'ACTUAL_ELAPSED_TIME',
+                                'AIR_TIME'] + DELAY_CAUSES] = np.nan
+        return flights[COLUMNS]
+
+
+def write_flights(rows, path, seed=0, chunk_rows=CHUNK_ROWS):
+    """Write `rows` synthetic flights to the CSV at `path`, one chunk at a time."""
+    generator = FlightGenerator(seed)
+    with open(path, 'w', newline='') as f:
+        for index, start in enumerate(range(0, rows, chunk_rows)):
+            chunk = generator.chunk(min(chunk_rows, rows - start), index)
+            chunk.to_csv(f, index=False, header=index == 0, float_format='%.0f')
+
+
+if __name__ == '__main__':
+    write_flights(int(sys.argv[1]), sys.argv[2], *(int(a) for a in sys.argv[3:4]))
@@ -0,0 +1,335 @@
+"""Altair charts of the dashboard sections.
+
+Each function builds one section's chart from the data and widget values it is
+given. None of them touches Streamlit, so the app can cache their specs per
+widget state (see query_cache.py) and they can be built headlessly.
+"""
+import altair as alt
+
+from basemap import REMOTE_TOPOJSON
+from flight_data import (
+    DELAY_TYPES, DISTANCE_CELL, HISTOGRAM_BIN, LATE_AIRCRAFT_CELL, airport_summary,
+    brushed_delay_counts, carrier_delay_stats, delay_histogram, delayed_status_counts,
+    delays_by_period, dep_arr_density, route_summary,
+)
+
+# Above this many flights the scatterplots switch to binned density charts; it
+# is Altair's default row limit, which the raw scatterplots must stay within
+DENSITY_THRESHOLD = 5_000
+
+
+def delay_overview(overview):
+    delay_per = alt.Chart(overview).mark_bar().encode(
+        x = alt.X('count:Q', title = 'Number of Flights'),
+        y = alt.Y('ON_TIME?:O', title = ''),
+        color = alt.Color('ON_TIME?', legend = None),
+    ).properties(width = 600, height = 160)
+
+    text = delay_per.mark_text(
+        align = 'left',
+        baseline = 'middle',
+        dx = 3  # Nudges text to right so it doesn't appear on top of the bar
+    ).encode(
+        text = 'count:Q'
+    )
+
+    return delay_per + text
+
+
+def delay_distribution(pairs):
+    # One brush shared by every panel: brushing a panel replaces the brush of
+    # any other, as the store of a global selection holds a single interval.
+    # It tests the field of the brushed panel's x, named after its delay type,
+    # so each row of the 2-D bin counts carries its source bin under the name
+    # of its source delay type only; no raw rows are embedded
+    brush = alt.selection_interval(encodings=['x'], empty='none', resolve='global', name='brush')
+    brushing = "length(data('brush_store'))"
+    src_fields = {
+        delay_type: f"datum.src == '{delay_type}' ? datum.src_start : null"
+        for delay_type in DELAY_TYPES
+    }
+
+    panels = []
+    for delay_type in DELAY_TYPES:
+        axis = alt.Axis(format='d', titleAnchor='start')
+
+        hist = alt.Chart(delay_histogram(pairs, delay_type)).mark_bar().encode(
+            alt.X(f'{delay_type}:Q', bin='binned', title=delay_type, axis=axis),
+            alt.X2('bin_end:Q'),
+            alt.Y('count:Q', title=None, scale=alt.Scale(type='log')),
+            color=alt.condition(brushing, alt.value('lightgrey'), alt.value('#4c78a8')),
+            tooltip=['count:Q']
+        ).transform_calculate(
+            bin_end=f'datum.{delay_type} + {HISTOGRAM_BIN}'
+        ).add_selection(brush)
+
+        brushed = alt.Chart(brushed_delay_counts(pairs, delay_type)).mark_bar().encode(
+            alt.X('bin_start:Q', bin='binned', title=delay_type, axis=axis),
+            alt.X2('bin_end:Q'),
+            alt.Y('sum(count):Q', title=None, scale=alt.Scale(type='log')),
+            tooltip=[alt.Tooltip('sum(count):Q', title='count')]
+        ).transform_calculate(
+            bin_end=f'datum.bin_start + {HISTOGRAM_BIN}', **src_fields
+        ).transform_filter(brush)
+
+        panels.append(alt.layer(hist, brushed).properties(width=600, height=100))
+
+    return alt.vconcat(*panels).configure_view(
+        stroke='transparent'
+    )
+
+
+def status_by_option(cube, option):
+    if option == 'MONTH':
+        x = 'month(FL_DATE):O'
+    elif option == 'DATE':
+        x = 'date(FL_DATE):O'
+    elif option == 'CARRIER':
+        x = 'OP_CARRIER:O'
+    elif option == 'ORIGIN':
+        x = 'ORIGIN:O'
+    elif option == 'DEST':
+        x = 'DEST:O'
+
+    # Only slice the precomputed (value, STATUS) counts, no raw rows
+    counts = delayed_status_counts(cube, option)
+
+    if option == 'MONTH' or option == 'DATE':
+        x_axis = alt.X(x, title = option)
+    else:
+        x_axis = alt.X(x, axis = alt.Axis(labelOverlap = True), sort = '-y', title = option)
+
+    return alt.Chart(counts).mark_bar().encode(
+        x = x_axis,
+        y = alt.Y('sum(count):Q', title = 'Count Delayed Flights'),
+        color = 'STATUS',
+        tooltip = [alt.Tooltip(x, title = option), alt.Tooltip('sum(count):Q', title = 'Count Delayed Flights')],
+    ).properties(width = 800, height = 400).interactive()
+
+
+def route_map(route_index, airports, basemap, min_delay, max_delay,
+              collect_from='ORIGIN', connect_to='DEST'):
+    """Routes and airports over the states; `basemap` is the pre-projected states or None.
+
+    `route_index` is the RouteIndex of the delay type to color by.
+    """
+    if basemap is not None:
+        # Local states, already projected with albersUsa like the airports
+        states = alt.Data(values=basemap)
+        projection = 'identity'
+    else:
+        states = alt.topo_feature(REMOTE_TOPOJSON, feature='states')
+        projection = 'albersUsa'
+
+    # Create mouseover selection
+    select_city = alt.selection_single(
+        on="mouseover", fields=[collect_from], empty="none"
+    )
+
+    background = alt.Chart(states).mark_geoshape(
+        fill="lightgray",
+        stroke="white"
+    ).properties(
+        width=650,
+        height=400
+    ).project(projection)
+
+    scale = alt.Scale(
+        range=['green', 'orange', 'darkred'],
+        domain=(0,60)
+    )
+
+    routes = route_summary(route_index, airports, min_delay, max_delay,
+                           collect_from, connect_to)
+    airport_points = airport_summary(route_index, airports, min_delay, max_delay,
+                                     collect_from, connect_to)
+
+    connections = alt.Chart(routes).mark_rule(opacity=0.35).encode(
+        latitude="latitude:Q",
+        longitude="longitude:Q",
+        latitude2="lat2:Q",
+        longitude2="lon2:Q",
+        color=alt.Color("delay:Q", scale=scale),
+        size=alt.Size("count:Q",scale=alt.Scale(range=[0, 40], domain=(0, 20),type='linear'), legend=None),
+        tooltip=['ORIGIN:N', 'DEST:N', 'count:Q', 'delay:Q']
+    ).transform_filter(
+        select_city
+    )
+
+    points = alt.Chart(airport_points).mark_circle().encode(
+        latitude="latitude:Q",
+        longitude="longitude:Q",
+        size=alt.Size("routes:Q", scale=alt.Scale(range=[0, 1000]), legend=None),
+        order=alt.Order("routes:Q", sort="descending"),
+        color=alt.Color("average_delay:Q", scale=scale),
+        tooltip=[f"{collect_from}:N", "average_delay:Q"]
+    ).add_selection(
+        select_city
+    )
+
+    return (background + connections + points).configure_view(stroke=None)
+
+
+def carrier_delay_bars(counts):
+    """Exact mean carrier delay per carrier, with its count and quantiles as tooltips."""
+    return alt.Chart(carrier_delay_stats(counts)).mark_bar().encode(
+        x=alt.X("OP_CARRIER:N", sort='-y', title = 'Carrier'),
+        y=alt.Y("CARRIER_DELAY:Q", scale=alt.Scale(zero=False), title = 'Average Carrier Delay'),
+        tooltip=[alt.Tooltip("OP_CARRIER:N", title = 'Carrier'), alt.Tooltip("CARRIER_DELAY:Q", title = 'Average Carrier Delay'),
+                 alt.Tooltip("count:Q", title = 'Delayed Flights'), alt.Tooltip("p50:Q", title = 'Median'),
+                 alt.Tooltip("p90:Q", title = '90th Percentile')]
+    ).properties(
+        width=600, height=250
+    )
+
+
+def carrier_delay_points(sample, delay_type):
+    """Carrier delay strip plot over its scatter against `delay_type`, linked by an interval.
+
+    `sample` is a carrier_sample of the flights; delays are capped at 350 minutes.
+    The strip's tooltip gives the number of flights sampled of each carrier.
+    """
+    picked = alt.selection_interval()
+    points = sample[['OP_CARRIER', 'CARRIER_DELAY', 'ARR_DELAY']].assign(
+        CARRIER_DELAY=sample['CARRIER_DELAY'].clip(upper=350),
+        SELECTED_DELAY=sample[delay_type].clip(upper=350),
+        **{delay_type: sample[delay_type]},
+    )
+
+    carrier_delay_dist = alt.Chart(points).mark_point().transform_filter(
+        alt.datum['CARRIER_DELAY']>0
+    ).transform_joinaggregate(
+        sampled='count()', groupby=['OP_CARRIER']
+    ).encode(
+        x=alt.X("OP_CARRIER"),
+        y=alt.Y("CARRIER_DELAY", scale=alt.Scale(zero=False)),
+        order=alt.Order(
+            'average(CARRIER_DELAY)',
+            sort='descending'),
+        tooltip=['OP_CARRIER', 'CARRIER_DELAY', 'ARR_DELAY', alt.Tooltip('sampled:Q', title='Sampled flights')]
+    ).properties(
+        width=600, height=100
+    ).add_selection(picked)
+
+    select = alt.selection_single(on='mouseover', fields=['OP_CARRIER'])
+
+    carrier_vs_arr = alt.Chart(points).mark_point().transform_filter(
+        alt.datum['CARRIER_DELAY']>=0
+    ).encode(
+        x='SELECTED_DELAY:Q',
+        y=alt.Y("CARRIER_DELAY"),
+        color=alt.Color('OP_CARRIER'),
+        tooltip=[delay_type, 'CARRIER_DELAY','OP_CARRIER']
+    ).properties(
+        width=600, height=300
+    )
+
+    return carrier_delay_dist & carrier_vs_arr.transform_filter(picked).encode(
+        color=alt.condition(select, "OP_CARRIER:N", alt.value('lightgray'))
+    ).add_selection(select)
+
+
+def status_by_dep_arr(df, cells):
+    """Departure vs arrival time by STATUS; `cells` is used instead of `df` above DENSITY_THRESHOLD."""
+    selection = alt.selection_multi(fields = ['STATUS'])
+    brush = alt.selection(type='interval')
+
+    color_select_brush = alt.condition(selection | brush,
+                          alt.Color('STATUS:N', legend = None),
+                          alt.value('lightgrey'))
+
+    color_select = alt.condition(selection,
+                          alt.Color('STATUS:N', legend = None),
+                          alt.value('lightgrey'))
+
+    if len(df) > DENSITY_THRESHOLD:
+        # Aggregated rendering: one circle per half-hour cell and STATUS
+        data = dep_arr_density(cells)
+        flight_count = 'sum(count):Q'
+    else:
+        data = df
+        flight_count = 'count(STATUS):Q'
+
+    dep_arr = alt.Chart(data).mark_circle().encode(
+        x = alt.X('CRS_DEP_TIME:Q', title = 'Departure Time', axis = alt.Axis(labelOverlap = True)),
+        y = alt.Y('CRS_ARR_TIME:Q', title = 'Arrival Time', axis = alt.Axis(labelOverlap = True), sort = '-y'),
+        color = color_select_brush,
+        size = alt.Size('average(ARR_DELAY):Q', title = 'Arrival Delay', scale = alt.Scale(domain = [1, 800]), legend = None),
+        tooltip = [alt.Tooltip('CRS_DEP_TIME', title = 'Departure Time'), alt.Tooltip('CRS_ARR_TIME', title = 'Arrival Time'), \
+        alt.Tooltip('average(ARR_DELAY):Q', title = 'Arrival Delay')],
+    ).add_selection(brush).properties(width = 600, height = 400)
+
+    bars = alt.Chart(data).mark_bar().encode(
+        y = alt.Y('STATUS', title = ''),
+        color = color_select,
+        x = alt.X(flight_count, title = 'Delayed Flights Count'),
+    ).transform_filter(
+        brush
+    )
+
+    bar_text = bars.mark_text(
+        align = 'left',
+        baseline = 'middle',
+        dx = 3  # Nudges text to right so it doesn't appear on top of the bar
+    ).encode(
+        text = flight_count
+    )
+
+    count = alt.Chart(data).mark_bar().transform_filter(alt.datum['STATUS'] != 'on time').encode(
+        x = alt.X(flight_count, title = 'Total Delayed Flights Count'),
+    ).transform_filter(
+        brush
+    )
+
+    count_text = count.mark_text(
+        align = 'left',
+        baseline = 'middle',
+        dx = 3
+    ).encode(
+        text = flight_count
+    )
+
+    legend = alt.Chart(data).mark_point().encode(
+        y = alt.Y('STATUS:N', axis = alt.Axis(orient = 'right')),
+        color = color_select
+    ).add_selection(
+        selection
+    )
+
+    return (dep_arr & (count + count_text) & (bars + bar_text) ) | legend
+
+
+def delay_by_month_date(daily, option):
+    if option == 'Month':
+        x = 'month(FL_DATE):O'
+    elif option == 'Date':
+        x = 'date(FL_DATE):O'
+
+    # At most 31 periods x 5 delay types, summed server-side
+    delays = delays_by_period(daily, option)
+
+    return alt.Chart(delays).mark_area().encode(
+        x = alt.X(x, title = option),
+        y = alt.Y('sum(delay)', title = 'Delay'),
+        color = 'delay_type:N',
+    ).properties(width = 600, height = 400).interactive()
+
+
+def late_aircraft_delay_by_distance(df, cells):
+    if len(df) > DENSITY_THRESHOLD:
+        # Aggregated rendering: flight counts per distance x delay cell
+        return alt.Chart(cells).mark_rect().encode(
+            x = alt.X('DISTANCE:Q', bin = 'binned', title = 'DISTANCE'),
+            x2 = 'distance_end:Q',
+            y = alt.Y('LATE_AIRCRAFT_DELAY:Q', bin = 'binned', title = 'LATE_AIRCRAFT_DELAY'),
+            y2 = 'delay_end:Q',
+            color = alt.Color('count:Q', scale = alt.Scale(type = 'log'), title = 'Flights'),
+            tooltip = ['DISTANCE:Q', 'LATE_AIRCRAFT_DELAY:Q', 'count:Q'],
+        ).transform_calculate(
+            distance_end = f'datum.DISTANCE + {DISTANCE_CELL}',
+            delay_end = f'datum.LATE_AIRCRAFT_DELAY + {LATE_AIRCRAFT_CELL}',
+        ).properties(width = 600, height = 400)
+    return alt.Chart(df).mark_point().encode(
+        x = 'DISTANCE',
+        y = 'LATE_AIRCRAFT_DELAY',
+    ).properties(width = 600, height = 400)
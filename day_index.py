@@ -0,0 +1,80 @@
+"""Day index over day-sorted flights, for date-range queries.
+
+`DayIndex` is built from the per-day aggregates of flights ordered by FL_DATE,
+as the stores are (see flight_store): the flight counts per STATUS and the
+minutes per delay cause of every day. It keeps prefix sums of both over the
+days, and the row offset where every day starts, which is the number of
+flights of the days before. A date range then maps to a contiguous slice of
+rows by two binary searches over the days. Its totals are differences of two
+prefix sums, and its per-day breakdowns are a slice of the day arrays. Neither
+building nor querying it touches the rows.
+"""
+import numpy as np
+import pandas as pd
+
+from flight_data import DELAY_CAUSES, STATUS_LABELS
+
+
+def _prefix(per_day):
+    return np.vstack([np.zeros((1, per_day.shape[1]), dtype=np.int64), np.cumsum(per_day, axis=0)])
+
+
+class DayIndex:
+    def __init__(self, daily_status, daily_delays):
+        """From the daily_status and daily_delays aggregates of the day-sorted flights."""
+        self.days = daily_status.index.to_numpy()
+        self.status_counts = daily_status[STATUS_LABELS].to_numpy(dtype=np.int64)
+        self.delay_sums = daily_delays.reindex(daily_status.index, fill_value=0)[DELAY_CAUSES].to_numpy(dtype=np.int64)
+        # Every flight has a STATUS, so the days' flight counts give their row offsets
+        self.offsets = np.r_[0, np.cumsum(self.status_counts.sum(axis=1))]
+        self.status_prefix = _prefix(self.status_counts)
+        self.delay_prefix = _prefix(self.delay_sums)
+
+    @property
+    def first_day(self):
+        return pd.Timestamp(self.days[0])
+
+    @property
+    def last_day(self):
+        return pd.Timestamp(self.days[-1])
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.days, self.offsets, self.status_counts, self.delay_sums,
+                                      self.status_prefix, self.delay_prefix))
+
+    def bounds(self, start, end):
+        """Positions [lo, hi) of the days from `start` to `end`, both included."""
+        lo = np.searchsorted(self.days, np.datetime64(pd.Timestamp(start)), side='left')
+        hi = np.searchsorted(self.days, np.datetime64(pd.Timestamp(end)), side='right')
+        return lo, max(hi, lo)
+
+    def rows(self, start, end):
+        """Slice of the day-sorted rows of the flights from `start` to `end`."""
+        lo, hi = self.bounds(start, end)
+        return slice(self.offsets[lo], self.offsets[hi])
+
+    def status_totals(self, start, end):
+        """Number of flights per STATUS between the dates."""
+        lo, hi = self.bounds(start, end)
+        return pd.Series(self.status_prefix[hi] - self.status_prefix[lo], index=STATUS_LABELS)
+
+    def delay_totals(self, start, end):
+        """Minutes of each delay cause between the dates."""
+        lo, hi = self.bounds(start, end)
+        return pd.Series(self.delay_prefix[hi] - self.delay_prefix[lo], index=DELAY_CAUSES)
+
+    def daily_delays(self, start, end):
+        """Minutes per delay cause of each day between the dates, as daily_delay_totals."""
+        lo, hi = self.bounds(start, end)
+        index = pd.DatetimeIndex(self.days[lo:hi], name='FL_DATE')
+        return pd.DataFrame(self.delay_sums[lo:hi], index=index, columns=DELAY_CAUSES)
+
+    def daily_status(self, start, end):
+        """Flights per (FL_DATE, STATUS) of each day between the dates, zero counts left out."""
+        lo, hi = self.bounds(start, end)
+        counts = pd.DataFrame(self.status_counts[lo:hi], columns=STATUS_LABELS,
+                              index=pd.DatetimeIndex(self.days[lo:hi], name='FL_DATE'))
+        counts = counts.rename_axis(columns='STATUS').stack().rename('count').reset_index()
+        counts['STATUS'] = pd.Categorical(counts['STATUS'], categories=STATUS_LABELS)
+        return counts[counts['count'] > 0]
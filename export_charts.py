@@ -0,0 +1,202 @@
+"""Headless export of every dashboard chart variant.
+
+Builds each section's chart for every selectbox option (and the maps for
+every delay type and side, over the sliders' default range) with the
+Streamlit-free builders in charts.py, spread over worker processes. Each
+variant is written as `<variant>.vl.json` whose datasets are referenced by URL
+from `data/<dataset>.json`; datasets shared by several variants are written
+once. `index.json` lists the variants with their widget values and files.
+
+    python export_charts.py OUT_DIR [--source CSV_OR_DIR] [--workers N] [--png]
+
+--png also renders `<variant>.png` with vl-convert, which must then be installed
+and support the Vega-Lite version of the installed Altair.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import altair as alt
+import pandas as pd
+
+import charts
+from aggregates import build_aggregates
+from basemap import load_basemap, project_airports
+from flight_data import DELAY_TYPES, STATUS_OPTIONS, airport_index
+from flight_store import read_stores, store_paths, tmp_path
+from route_index import RouteIndex
+
+DEFAULT_SOURCE = '2018-5k.csv'
+AIRPORTS_CSV = 'airport.csv'
+# Default positions of the map's min / max delay sliders
+MAP_DELAY_RANGE = (-100, 1000)
+
+
+def chart_variants():
+    """[(variant name, section, widget values)] of every chart the dashboard can draw."""
+    variants = [
+        ('delay_per', 'delay_per', {}),
+        ('delay_distribution', 'delay_distribution', {}),
+        ('carrier_delay', 'carrier_delay', {}),
+        ('status_by_dep_arr', 'status_by_dep_arr', {}),
+        ('late_aircraft_delay_by_distance', 'late_aircraft_delay_by_distance', {}),
+    ]
+    variants += [(f'status_by_option-{option}', 'status_by_option', {'option': option})
+                 for option in STATUS_OPTIONS]
+    variants += [(f'delay_by_month_date-{option}', 'delay_by_month_date', {'option': option})
+                 for option in ['Month', 'Date']]
+    variants += [(f'carrier_delay_points-{delay_type}', 'carrier_delay_points', {'delay_type': delay_type})
+                 for delay_type in DELAY_TYPES if delay_type != 'CARRIER_DELAY']
+    for collect_from, connect_to in [('ORIGIN', 'DEST'), ('DEST', 'ORIGIN')]:
+        variants += [(f'plot_map-{collect_from}-{delay_type}', 'plot_map',
+                      {'collect_from': collect_from, 'connect_to': connect_to, 'delay_type': delay_type,
+                       'min_delay': MAP_DELAY_RANGE[0], 'max_delay': MAP_DELAY_RANGE[1]})
+                     for delay_type in DELAY_TYPES]
+    return variants
+
+
+class ExportContext:
+    """The data every section draws from, loaded once per worker process."""
+
+    def __init__(self, paths):
+        self.df = read_stores(paths)
+        self.aggregates = build_aggregates(paths, max_workers=1)
+        self.basemap = load_basemap()
+        self.airports = airport_index(pd.read_csv(AIRPORTS_CSV), self.df)
+        if self.basemap is not None:
+            self.airports = project_airports(self.airports)
+        self._route_indexes = {}
+
+    def route_index(self, delay_type):
+        if delay_type not in self._route_indexes:
+            self._route_indexes[delay_type] = RouteIndex(self.aggregates['route_delays'][delay_type], delay_type)
+        return self._route_indexes[delay_type]
+
+    def build(self, section, widgets):
+        agg = self.aggregates
+        if section == 'delay_per':
+            return charts.delay_overview(agg['overview'])
+        if section == 'delay_distribution':
+            return charts.delay_distribution(agg['delay_bins'])
+        if section == 'status_by_option':
+            return charts.status_by_option(agg['status_cube'], widgets['option'])
+        if section == 'plot_map':
+            return charts.route_map(self.route_index(widgets['delay_type']), self.airports, self.basemap,
+                                    widgets['min_delay'], widgets['max_delay'],
+                                    widgets['collect_from'], widgets['connect_to'])
+        if section == 'carrier_delay':
+            return charts.carrier_delay_bars(agg['carrier_delay'])
+        if section == 'carrier_delay_points':
+            return charts.carrier_delay_points(agg['carrier_sample'], widgets['delay_type'])
+        if section == 'status_by_dep_arr':
+            return charts.status_by_dep_arr(self.df, agg['dep_arr_cells'])
+        if section == 'delay_by_month_date':
+            return charts.delay_by_month_date(agg['daily_delays'], widgets['option'])
+        if section == 'late_aircraft_delay_by_distance':
+            return charts.late_aircraft_delay_by_distance(self.df, agg['distance_delay_cells'])
+        raise ValueError(f'unknown section {section!r}')
+
+
+def _write_json(value, path):
+    tmp = tmp_path(path)
+    with open(tmp, 'w') as f:
+        json.dump(value, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def _reference_datasets(spec, urls):
+    """Replace the named inline datasets in `spec` by their URLs, in place."""
+    if isinstance(spec, dict):
+        data = spec.get('data')
+        if isinstance(data, dict) and data.get('name') in urls:
+            spec['data'] = {'url': urls[data['name']], 'format': {'type': 'json'}}
+        for value in spec.values():
+            _reference_datasets(value, urls)
+    elif isinstance(spec, list):
+        for value in spec:
+            _reference_datasets(value, urls)
+
+
+def _vl_version(spec):
+    # e.g. https://vega.github.io/schema/vega-lite/v4.17.0.json -> 4.17
+    return '.'.join(spec['$schema'].rsplit('/v', 1)[1].split('.')[:2])
+
+
+_context = None
+
+
+def _init_worker(paths):
+    global _context
+    # The exported specs are files, not browser payloads, so any number of rows is fine
+    alt.data_transformers.disable_max_rows()
+    _context = ExportContext(paths)
+
+
+def export_variant(name, section, widgets, out_dir, png=False):
+    """Write one variant's spec, datasets and optionally PNG; returns its index entry."""
+    start = time.perf_counter()
+    spec = _context.build(section, widgets).to_dict()
+    if png:
+        import vl_convert
+
+        with open(os.path.join(out_dir, f'{name}.png'), 'wb') as f:
+            f.write(vl_convert.vegalite_to_png(spec, vl_version=_vl_version(spec)))
+
+    datasets = spec.pop('datasets', {})
+    urls = {}
+    for dataset, values in datasets.items():
+        urls[dataset] = f'data/{dataset}.json'
+        path = os.path.join(out_dir, urls[dataset])
+        # Dataset names are content hashes, so an existing file already holds these rows
+        if not os.path.exists(path):
+            _write_json(values, path)
+    _reference_datasets(spec, urls)
+    _write_json(spec, os.path.join(out_dir, f'{name}.vl.json'))
+    return {
+        'variant': name,
+        'section': section,
+        'widgets': widgets,
+        'spec': f'{name}.vl.json',
+        'data': sorted(urls.values()),
+        'png': f'{name}.png' if png else None,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def export_charts(out_dir, source=DEFAULT_SOURCE, max_workers=None, png=False):
+    """Export every chart variant of the dashboard over `source` to `out_dir`."""
+    os.makedirs(os.path.join(out_dir, 'data'), exist_ok=True)
+    paths = store_paths(source)
+    # Build the aggregates before forking, so the workers only load them
+    build_aggregates(paths)
+
+    variants = chart_variants()
+    workers = min(len(variants), max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(paths,)) as pool:
+        futures = [pool.submit(export_variant, name, section, widgets, out_dir, png)
+                   for name, section, widgets in variants]
+        entries = [future.result() for future in futures]
+
+    index = {'source': source, 'stores': [os.path.basename(p) for p in paths], 'variants': entries}
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='a flight CSV or a directory of CSV partitions')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--png', action='store_true', help='also render PNGs with vl-convert')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    entries = export_charts(args.out_dir, args.source, args.workers, args.png)
+    print(f'exported {len(entries)} charts to {args.out_dir} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+"""Derived columns and server-side aggregation of the flight data.
+
+The charts used to receive every flight row and aggregate in the browser.
+The helpers here do the grouping in pandas so that the embedded chart data
+scales with the number of groups (routes, airports, ...) instead of flights.
+"""
+import numpy as np
+import pandas as pd
+
+STATUS_LABELS = ['on time', 'slightly delayed', 'delayed', 'diverted', 'cancelled']
+ON_TIME_LABELS = ['On Time', 'Delayed']
+STATUS_OPTIONS = ['MONTH', 'DATE', 'CARRIER', 'ORIGIN', 'DEST']
+DELAY_CAUSES = ['CARRIER_DELAY', 'WEATHER_DELAY', 'NAS_DELAY', 'SECURITY_DELAY', 'LATE_AIRCRAFT_DELAY']
+DELAY_TYPES = ['ARR_DELAY', 'DEP_DELAY'] + DELAY_CAUSES
+
+# Fixed 10-minute histogram bins; values outside a range are clamped into its end bins
+HISTOGRAM_BIN = 10
+HISTOGRAM_RANGES = {'ARR_DELAY': (-100, 300), 'DEP_DELAY': (-100, 300)}
+DEFAULT_HISTOGRAM_RANGE = (0, 600)
+
+# Cell sizes of the binned (density) scatterplots
+TIME_CELL_MINUTES = 30
+DISTANCE_CELL = 100
+LATE_AIRCRAFT_CELL = 10
+
+# Territories outside the albersUsa projection of the maps
+UNMAPPED_STATES = ['PR', 'VI', 'GU', 'AS', 'MP']
+
+# Quantiles of the carrier delay shown per carrier
+CARRIER_QUANTILES = [0.25, 0.5, 0.75, 0.9]
+# Flights of each carrier drawn as points, the columns kept of them and the
+# columns that identify a flight, whose hash orders the flights to sample
+SAMPLE_PER_CARRIER = 2_000
+SAMPLE_COLUMNS = ['OP_CARRIER'] + DELAY_TYPES
+FLIGHT_KEY_COLUMNS = ['FL_DATE', 'OP_CARRIER', 'OP_CARRIER_FL_NUM', 'ORIGIN']
+
+
+def classify_status(df):
+    """Return the STATUS and ON_TIME? labels of each flight as categoricals.
+
+    Cancelled takes precedence over diverted, which takes precedence over the
+    ARR_DELAY thresholds (>= 30 delayed, > 0 slightly delayed, else on time).
+    """
+    arr_delay = df['ARR_DELAY'].to_numpy()
+    cancelled = df['CANCELLED'].to_numpy() == 1
+    diverted = df['DIVERTED'].to_numpy() == 1
+    late = arr_delay > 0
+
+    status = np.select(
+        [cancelled, diverted, arr_delay >= 30, late],
+        [4, 3, 2, 1],
+        default=0,
+    ).astype(np.int8)
+    on_time = (cancelled | diverted | late).astype(np.int8)
+    return (
+        pd.Categorical.from_codes(status, STATUS_LABELS),
+        pd.Categorical.from_codes(on_time, ON_TIME_LABELS),
+    )
+
+
+def add_status_columns(df):
+    """Label each flight with its STATUS and ON_TIME? category."""
+    df['STATUS'], df['ON_TIME?'] = classify_status(df)
+    return df
+
+
+def on_time_counts(df):
+    return df['ON_TIME?'].value_counts(sort=False).rename_axis('ON_TIME?').rename('count').reset_index()
+
+
+def on_time_from_status(status_totals):
+    """on_time_counts from the number of flights per STATUS."""
+    on_time = status_totals['on time']
+    return pd.DataFrame({
+        'ON_TIME?': pd.Categorical(ON_TIME_LABELS, categories=ON_TIME_LABELS),
+        'count': [on_time, status_totals.sum() - on_time],
+    })
+
+
+def carrier_delay_counts(df):
+    """Number of carrier-caused delays per (carrier, minutes of CARRIER_DELAY)."""
+    delayed = df[df['CARRIER_DELAY'] > 0]
+    counts = delayed.groupby(['OP_CARRIER', 'CARRIER_DELAY'], observed=True).size()
+    return counts.rename('count').reset_index()
+
+
+def carrier_delay_stats(counts):
+    """Count, mean and CARRIER_QUANTILES (nearest rank) of the carrier delays per carrier.
+
+    Delays are whole minutes, so their counts give the exact statistics.
+    """
+    stats = []
+    for carrier, values in counts.sort_values('CARRIER_DELAY').groupby('OP_CARRIER', observed=True):
+        delays = values['CARRIER_DELAY'].to_numpy()
+        ranks = values['count'].to_numpy().cumsum()
+        flights = ranks[-1]
+        row = {'OP_CARRIER': carrier, 'count': flights, 'CARRIER_DELAY': (delays * values['count']).sum() / flights}
+        for q in CARRIER_QUANTILES:
+            row[f'p{round(q * 100)}'] = delays[np.searchsorted(ranks, q * flights)]
+        stats.append(row)
+    columns = ['OP_CARRIER', 'count', 'CARRIER_DELAY'] + [f'p{round(q * 100)}' for q in CARRIER_QUANTILES]
+    # Same columns without any carrier delay, e.g. over a single quiet day
+    return pd.DataFrame(stats, columns=columns)
+
+
+def _first_per_carrier(carriers, keys, per_carrier):
+    """Positions of the `per_carrier` smallest `keys` of each carrier, in their original order."""
+    codes = carriers.cat.codes.to_numpy()
+    order = np.lexsort((keys, codes))
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    # Position of each flight in its carrier's run, ordered by key
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return np.sort(order[rank < per_carrier])
+
+
+def carrier_sample(df, columns=SAMPLE_COLUMNS, per_carrier=SAMPLE_PER_CARRIER):
+    """`columns` of at most `per_carrier` random flights of each carrier, among its carrier delays.
+
+    Only flights with a CARRIER_DELAY are drawn, as only those are charted.
+    Flights are ranked by a hash of FLIGHT_KEY_COLUMNS, kept as `sample_key`,
+    so a flight is picked the same way whichever partition or date range it
+    is read from, and samples of partitions merge exactly. Carriers with
+    fewer such flights keep all of them.
+    """
+    df = df[df['CARRIER_DELAY'] > 0]
+    keys = pd.util.hash_pandas_object(df[FLIGHT_KEY_COLUMNS], index=False).to_numpy()
+    picked = _first_per_carrier(df['OP_CARRIER'], keys, per_carrier)
+    return df[columns].iloc[picked].assign(sample_key=keys[picked]).reset_index(drop=True)
+
+
+def merge_carrier_samples(samples, per_carrier=SAMPLE_PER_CARRIER):
+    """The carrier_sample of several partitions' flights, from their samples."""
+    if len(samples) == 1:
+        return samples[0]
+    sample = pd.concat(samples, ignore_index=True)
+    sample['OP_CARRIER'] = sample['OP_CARRIER'].astype('category')
+    picked = _first_per_carrier(sample['OP_CARRIER'], sample['sample_key'].to_numpy(), per_carrier)
+    return sample.iloc[picked].reset_index(drop=True)
+
+
+def _status_values(df, option):
+    if option == 'MONTH':
+        return df['FL_DATE'].dt.month
+    if option == 'DATE':
+        return df['FL_DATE'].dt.day
+    return df['OP_CARRIER' if option == 'CARRIER' else option]
+
+
+def status_cube(df, options=STATUS_OPTIONS):
+    """Flight counts per (value, STATUS) for each of the `options` groupings."""
+    cube = {}
+    for option in options:
+        counts = df.groupby([_status_values(df, option).rename(option), 'STATUS'], observed=True).size()
+        cube[option] = counts.rename('count').reset_index()
+    return cube
+
+
+def period_status_counts(daily_status, option):
+    """The MONTH or DATE slice of status_cube, from flights per (FL_DATE, STATUS)."""
+    dates = daily_status['FL_DATE'].dt
+    periods = (dates.month if option == 'MONTH' else dates.day).rename(option)
+    counts = daily_status.groupby([periods, 'STATUS'], observed=True)['count'].sum()
+    return counts.reset_index()
+
+
+def delayed_status_counts(cube, option):
+    """Slice of the status cube for one grouping, without the on-time flights.
+
+    MONTH and DATE come back as a representative FL_DATE so that the chart can
+    keep using the month() / date() time units.
+    """
+    counts = cube[option]
+    counts = counts[counts['STATUS'] != 'on time']
+    if option in ('MONTH', 'DATE'):
+        dates = representative_dates(counts[option], option)
+        return counts.drop(columns=option).assign(FL_DATE=dates)
+    if option == 'CARRIER':
+        return counts.rename(columns={'CARRIER': 'OP_CARRIER'})
+    return counts
+
+
+def representative_dates(values, unit):
+    """Dates in 2000 whose month (unit 'MONTH') or day of month ('DATE') is `values`."""
+    if unit == 'MONTH':
+        return pd.to_datetime({'year': 2000, 'month': values, 'day': 1})
+    return pd.to_datetime({'year': 2000, 'month': 1, 'day': values})
+
+
+def daily_status_counts(df):
+    """Number of flights per FL_DATE (rows) and STATUS (columns)."""
+    counts = df.groupby(['FL_DATE', 'STATUS'], observed=True).size().unstack('STATUS', fill_value=0)
+    counts.columns = counts.columns.astype(str)
+    return counts.reindex(columns=STATUS_LABELS, fill_value=0).rename_axis(columns=None)
+
+
+def daily_delay_totals(df):
+    """Total minutes of each delay cause per FL_DATE."""
+    return df.groupby('FL_DATE')[DELAY_CAUSES].sum()
+
+
+def delays_by_period(daily, option):
+    """Delay minutes per cause summed by month ('Month') or day of month ('Date').
+
+    Returned long, one row per (period, delay_type), with a representative
+    FL_DATE so that the chart can keep using the month() / date() time units.
+    """
+    unit = 'MONTH' if option == 'Month' else 'DATE'
+    dates = daily.index
+    periods = dates.month if unit == 'MONTH' else dates.day
+    totals = daily.groupby(periods).sum()
+    totals.index = representative_dates(totals.index.to_series(), unit)
+    totals.index.name = 'FL_DATE'
+    delays = totals.stack().rename('delay').rename_axis(['FL_DATE', 'delay_type'])
+    return delays.reset_index()
+
+
+def histogram_edges(delay_type):
+    low, high = HISTOGRAM_RANGES.get(delay_type, DEFAULT_HISTOGRAM_RANGE)
+    return np.arange(low, high + HISTOGRAM_BIN, HISTOGRAM_BIN)
+
+
+def histogram_bins(values, delay_type):
+    """Index of the histogram bin of each value, clamping outliers into the end bins."""
+    edges = histogram_edges(delay_type)
+    bins = (np.asarray(values, dtype=np.int32) - edges[0]) // HISTOGRAM_BIN
+    return np.clip(bins, 0, len(edges) - 2)
+
+
+def delay_bin_pairs(df):
+    """Flight counts per pair of (delay type, bin) for every two delay types.
+
+    Pairs of a delay type with itself only fill the diagonal and are its
+    plain histogram. Zero counts are left out.
+    """
+    bins = {delay_type: histogram_bins(df[delay_type].to_numpy(), delay_type) for delay_type in DELAY_TYPES}
+    sizes = {delay_type: len(histogram_edges(delay_type)) - 1 for delay_type in DELAY_TYPES}
+
+    pairs = []
+    for src in DELAY_TYPES:
+        for dst in DELAY_TYPES:
+            counts = np.bincount(bins[src] * sizes[dst] + bins[dst], minlength=sizes[src] * sizes[dst])
+            cells = np.flatnonzero(counts)
+            pairs.append(pd.DataFrame({
+                'src': src,
+                'src_bin': cells // sizes[dst],
+                'dst': dst,
+                'dst_bin': cells % sizes[dst],
+                'count': counts[cells],
+            }))
+    return pd.concat(pairs, ignore_index=True)
+
+
+def delay_histogram(pairs, delay_type):
+    """Histogram of one delay type, with the bin start in a column named after it."""
+    edges = histogram_edges(delay_type)
+    hist = pairs[(pairs['src'] == delay_type) & (pairs['dst'] == delay_type)]
+    return pd.DataFrame({
+        delay_type: edges[hist['dst_bin']],
+        'count': hist['count'].to_numpy(),
+    })
+
+
+def brushed_delay_counts(pairs, delay_type):
+    """Counts of `delay_type` bins broken down by the bin of every delay type.
+
+    `src_start` is the start of the bin of the `src` delay type the row was
+    counted in, and `bin_start` the start of the `delay_type` bin.
+    """
+    rows = pairs[pairs['dst'] == delay_type]
+    src_starts = np.empty(len(rows), dtype=np.int64)
+    for src in DELAY_TYPES:
+        is_src = (rows['src'] == src).to_numpy()
+        src_starts[is_src] = histogram_edges(src)[rows['src_bin'].to_numpy()[is_src]]
+    return pd.DataFrame({
+        'src': rows['src'].to_numpy(),
+        'src_start': src_starts,
+        'bin_start': histogram_edges(delay_type)[rows['dst_bin']],
+        'count': rows['count'].to_numpy(),
+    })
+
+
+def time_cells(hhmm):
+    """Round hhmm times down to the start of their TIME_CELL_MINUTES cell, still as hhmm."""
+    return hhmm // 100 * 100 + hhmm % 100 // TIME_CELL_MINUTES * TIME_CELL_MINUTES
+
+
+def dep_arr_cells(df):
+    """Number of flights and ARR_DELAY total per (departure cell, arrival cell, STATUS)."""
+    keys = [
+        time_cells(df['CRS_DEP_TIME']).rename('CRS_DEP_TIME'),
+        time_cells(df['CRS_ARR_TIME']).rename('CRS_ARR_TIME'),
+        'STATUS',
+    ]
+    cells = df.groupby(keys, observed=True)['ARR_DELAY'].agg(['count', 'sum'])
+    return cells.rename(columns={'sum': 'arr_delay_sum'}).reset_index()
+
+
+def dep_arr_density(cells):
+    return cells.assign(ARR_DELAY=cells['arr_delay_sum'] / cells['count'])
+
+
+def distance_delay_cells(df):
+    """Number of flights per (DISTANCE, LATE_AIRCRAFT_DELAY) cell, keyed by the cell starts."""
+    distance = df['DISTANCE'] // DISTANCE_CELL * DISTANCE_CELL
+    delay = df['LATE_AIRCRAFT_DELAY'] // LATE_AIRCRAFT_CELL * LATE_AIRCRAFT_CELL
+    return df.groupby([distance, delay]).size().rename('count').reset_index()
+
+
+def route_delay_counts(df, delay_types=DELAY_TYPES):
+    """Number of flights per (ORIGIN, DEST, minutes of delay) for each of `delay_types`.
+
+    One row per route and distinct delay rather than per flight; the RouteIndex
+    of a delay type is built from its table.
+    """
+    return {
+        delay_type: df.groupby(['ORIGIN', 'DEST', delay_type], observed=True).size().rename('count').reset_index()
+        for delay_type in delay_types
+    }
+
+
+def merge_counts(frames, keys):
+    """Sum additive (count/sum) aggregates of several partitions over their `keys`."""
+    if len(frames) == 1:
+        return frames[0]
+    merged = pd.concat(frames, ignore_index=True)
+    return merged.groupby(keys, observed=True).sum().reset_index()
+
+
+def merge_status_cubes(cubes):
+    return {option: merge_counts([cube[option] for cube in cubes], [option, 'STATUS']) for option in cubes[0]}
+
+
+def merge_route_delays(parts):
+    return {delay_type: merge_counts([part[delay_type] for part in parts], ['ORIGIN', 'DEST', delay_type])
+            for delay_type in parts[0]}
+
+
+def merge_daily_totals(frames):
+    """Daily totals of several partitions; a day split across partitions is summed."""
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames).groupby(level='FL_DATE').sum()
+
+
+def sort_by_day(df):
+    """`df` stably ordered by FL_DATE, as is when it already is (e.g. daily partitions)."""
+    if df['FL_DATE'].is_monotonic_increasing:
+        return df
+    order = np.argsort(df['FL_DATE'].to_numpy(), kind='stable')
+    return df.take(order).reset_index(drop=True)
+
+
+def airport_index(airports, df):
+    """IATA -> (state, latitude, longitude) of the mappable airports that appear in `df`.
+
+    `df` may be the flights or any table of their routes, such as a route_delays table.
+
+    Airports missing from airport.csv or in UNMAPPED_STATES are left out, so
+    joins against the index drop the flights that can't be drawn on the map.
+    """
+    used = set(df['ORIGIN'].unique()) | set(df['DEST'].unique())
+    mappable = airports['iata'].isin(used) & ~airports['state'].isin(UNMAPPED_STATES)
+    return airports[mappable].set_index('iata')[['state', 'latitude', 'longitude']].sort_index()
+
+
+def route_summary(routes, index, min_delay, max_delay,
+                  collect_from='ORIGIN', connect_to='DEST'):
+    """Flight count and average delay per (ORIGIN, DEST), with both ends' coordinates.
+
+    `routes` is the RouteIndex of the delay type; only flights within
+    [min_delay, max_delay] count.
+    """
+    counts, sums = routes.route_totals(min_delay, max_delay)
+    kept = counts > 0
+    summary = pd.DataFrame({
+        'ORIGIN': routes.airports('ORIGIN', routes.route_origin[kept]),
+        'DEST': routes.airports('DEST', routes.route_dest[kept]),
+        'count': counts[kept],
+        'delay': sums[kept] / counts[kept],
+    })
+
+    summary = summary.join(index[['latitude', 'longitude']], on=collect_from, how='inner')
+    summary = summary.join(
+        index.rename(columns={'latitude': 'lat2', 'longitude': 'lon2'}),
+        on=connect_to, how='inner'
+    )
+    return summary.reset_index(drop=True)
+
+
+def airport_summary(routes, index, min_delay, max_delay,
+                    collect_from='ORIGIN', connect_to='DEST'):
+    """Average delay and number of flights per `collect_from` airport, with coordinates."""
+    counts, sums = routes.route_totals(min_delay, max_delay)
+    codes, flights, delays = routes.airport_totals(collect_from, counts, sums)
+    kept = flights > 0
+    points = pd.DataFrame({
+        collect_from: routes.airports(collect_from, codes[kept]),
+        'average_delay': delays[kept] / flights[kept],
+        'routes': flights[kept],
+    })
+
+    points = points.join(index, on=collect_from, how='inner')
+    return points.reset_index(drop=True)
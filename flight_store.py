@@ -0,0 +1,323 @@
+"""Typed, columnar on-disk cache of the flight CSV files.
+
+Each source CSV is parsed and cleaned once, then written as an uncompressed
+Arrow/Feather file named after a hash of the CSV contents. Later runs memory-map
+that file instead of re-parsing the CSV and re-deriving the STATUS columns.
+
+The CSV is streamed in chunks of `CHUNK_ROWS` rows, each cleaned and appended
+to the file as a record batch, so ingesting a multi-gigabyte yearly BTS file
+only ever holds one chunk in memory. Stores are ordered by FL_DATE, so that a
+date range is a contiguous slice of rows (see day_index.py). Each chunk is
+sorted by day as it is read; when the chunks' days overlap, the store is
+rewritten once at ingest by merging them day by day.
+
+A data source is either one CSV or a directory of CSV partitions (e.g. one per
+day), each with its own store. The manifest remembers every partition's
+digest by size and modification time, so that appending a partition only
+hashes and ingests the new file rather than the whole history.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from flight_data import add_status_columns, sort_by_day
+from shared_data import SingleFlight
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.json')
+MANIFEST_LOCK_PATH = MANIFEST_PATH + '.lock'
+# Bump whenever the cleaning or the derived columns change, to invalidate old caches
+STORE_VERSION = 5
+
+COLUMNS = [
+    'FL_DATE', 'OP_CARRIER', 'OP_CARRIER_FL_NUM', 'ORIGIN', 'DEST',
+    'CRS_DEP_TIME', 'DEP_TIME', 'DEP_DELAY', 'TAXI_OUT', 'WHEELS_OFF',
+    'WHEELS_ON', 'TAXI_IN', 'CRS_ARR_TIME', 'ARR_TIME', 'ARR_DELAY',
+    'CANCELLED', 'CANCELLATION_CODE', 'DIVERTED', 'CRS_ELAPSED_TIME',
+    'ACTUAL_ELAPSED_TIME', 'AIR_TIME', 'DISTANCE', 'CARRIER_DELAY',
+    'WEATHER_DELAY', 'NAS_DELAY', 'SECURITY_DELAY', 'LATE_AIRCRAFT_DELAY',
+]
+CATEGORY_COLUMNS = ['OP_CARRIER', 'ORIGIN', 'DEST', 'CANCELLATION_CODE']
+FLAG_COLUMNS = ['CANCELLED', 'DIVERTED']
+# Carrier, weather, national air system and security
+CANCELLATION_CODES = ['A', 'B', 'C', 'D']
+# Read with float32 so missing values survive until the fillna in clean_flights
+READ_DTYPES = {
+    col: 'str' if col == 'FL_DATE' else 'category' if col in CATEGORY_COLUMNS else 'float32'
+    for col in COLUMNS
+}
+CHUNK_ROWS = 500_000
+# Ingests running in this process, so that sessions first asking for the same
+# partition at once wait for one ingest instead of each running their own
+_ingests = SingleFlight()
+
+# Declared rather than inferred from the first chunk, whose values may not tell
+# (e.g. no cancellations), so that every chunk and every partition's store
+# agree. Labels share one index width so that dictionaries can grow by deltas.
+LABEL = pa.dictionary(pa.int32(), pa.string())
+STORE_SCHEMA = pa.schema(
+    [(col, pa.timestamp('ns') if col == 'FL_DATE' else LABEL if col in CATEGORY_COLUMNS
+      else pa.int8() if col in FLAG_COLUMNS else pa.int16()) for col in COLUMNS]
+    + [('STATUS', LABEL), ('ON_TIME?', LABEL)]
+)
+
+
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tmp_path(path):
+    """A path next to `path`, unique to this process and thread, to write to before moving it there."""
+    return f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def _manifest_lock():
+    """Hold the manifest for this thread, against other threads and processes (e.g. a cron job)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(MANIFEST_LOCK_PATH, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _write_manifest(manifest):
+    tmp = tmp_path(MANIFEST_PATH)
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def _update_manifest(entries):
+    """Merge `entries` into the manifest on disk, keeping what others wrote since it was loaded."""
+    with _manifest_lock():
+        manifest = _load_manifest()
+        manifest.update(entries)
+        _write_manifest(manifest)
+
+
+def prune_stores():
+    """Delete the stores of older store versions and of partitions edited or deleted since.
+
+    Partitions that no longer exist are dropped from the manifest too.
+    """
+    with _manifest_lock():
+        manifest = _load_manifest()
+        existing = {key: entry for key, entry in manifest.items() if os.path.exists(key)}
+        if existing != manifest:
+            _write_manifest(existing)
+        current = {cache_path(key, entry['digest']) for key, entry in existing.items()}
+        for path in glob.glob(os.path.join(CACHE_DIR, '*.feather')):
+            if path not in current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # e.g. still mapped by another process on Windows; the next prune retries
+                    pass
+
+
+def partition_digest(csv_path, manifest):
+    """Digest of `csv_path`, rehashed only when its size or mtime differ from the manifest's."""
+    stat = os.stat(csv_path)
+    key = os.path.abspath(csv_path)
+    entry = manifest.get(key)
+    if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': file_digest(csv_path)}
+        manifest[key] = entry
+    return entry['digest']
+
+
+def partition_paths(source):
+    """The CSV partitions of `source`: a CSV path, a directory of CSVs or a list of either."""
+    if isinstance(source, str):
+        source = [source]
+    paths = []
+    for path in source:
+        paths.extend(sorted(glob.glob(os.path.join(path, '*.csv'))) if os.path.isdir(path) else [path])
+    return paths
+
+
+def cache_path(csv_path, digest=None):
+    digest = digest or file_digest(csv_path)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(CACHE_DIR, f'{name}-{digest[:16]}-v{STORE_VERSION}.feather')
+
+
+def clean_flights(raw, categories=None):
+    """Give the raw BTS columns compact dtypes and add the derived columns.
+
+    `categories` maps each categorical column to the categories seen so far.
+    New values are appended to it in place, so that chunks cleaned one after
+    another share the same codes.
+    """
+    df = pd.DataFrame()
+    for col in COLUMNS:
+        if col == 'FL_DATE':
+            df[col] = pd.to_datetime(raw[col])
+        elif col in CATEGORY_COLUMNS:
+            values = raw[col].astype('category')
+            if categories is not None:
+                known = categories.setdefault(col, [])
+                seen = set(known)
+                known.extend(c for c in values.cat.categories if c not in seen)
+                values = values.cat.set_categories(known)
+            # String categories even for a chunk without any value of the column
+            df[col] = values.cat.set_categories(pd.Index(values.cat.categories, dtype=str))
+        elif col in FLAG_COLUMNS:
+            df[col] = raw[col].fillna(0).astype('int8')
+        else:
+            # delays, hhmm times, durations and distance all fit in 16 bits
+            df[col] = raw[col].fillna(0).astype('int16')
+    return add_status_columns(df)
+
+
+def _new_writer(sink):
+    # IPC files are written uncompressed, so they can be memory-mapped
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    return pa.ipc.new_file(sink, STORE_SCHEMA, options=options)
+
+
+def sort_store(path, out_path, batch_rows=CHUNK_ROWS):
+    """Merge the batches of the store at `path`, each ordered by FL_DATE, into `out_path`.
+
+    Each day's rows are taken from every batch in turn, so rows of the same day
+    keep their order in the store. The batches stay memory-mapped; only the
+    output batch being filled (about `batch_rows` rows) is copied into memory.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(path))
+    # Read back from the file, every batch carries the final dictionaries
+    batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+    dates = [batch.column('FL_DATE').to_numpy() for batch in batches]
+    days = np.unique(np.concatenate([np.unique(d) for d in dates]))
+    # Where each day starts and ends in each batch
+    bounds = [(np.searchsorted(d, days, 'left'), np.searchsorted(d, days, 'right')) for d in dates]
+
+    with pa.OSFile(out_path, 'wb') as sink, _new_writer(sink) as writer:
+        pending, rows = [], 0
+        for day in range(len(days)):
+            for batch, (starts, ends) in zip(batches, bounds):
+                if ends[day] > starts[day]:
+                    pending.append(batch.slice(starts[day], ends[day] - starts[day]))
+                    rows += ends[day] - starts[day]
+            if rows >= batch_rows or day == len(days) - 1:
+                writer.write_table(pa.Table.from_batches(pending).combine_chunks())
+                pending, rows = [], 0
+
+
+def ingest_csv(csv_path, out_path, chunk_rows=CHUNK_ROWS, progress=None):
+    """Stream `csv_path` into a typed Arrow file at `out_path`, ordered by day.
+
+    `progress`, if given, is called with the fraction of the CSV read so far.
+    """
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp, sorted_tmp = tmp_path(out_path), tmp_path(out_path + '.sorted')
+    total_bytes = os.path.getsize(csv_path) or 1
+    # An IPC file can't grow a dictionary that started out empty, which a first
+    # chunk without cancellations would give; all their codes are known anyway
+    categories = {'CANCELLATION_CODE': list(CANCELLATION_CODES)}
+    writer = None
+    # Whether the chunks so far follow each other in date order, and the last date seen
+    in_order, last_day = True, None
+
+    try:
+        with open(csv_path, 'rb') as csv_file, pa.OSFile(tmp, 'wb') as sink:
+            chunks = pd.read_csv(csv_file, usecols=COLUMNS, dtype=READ_DTYPES, chunksize=chunk_rows)
+            for chunk in chunks:
+                # Sorted on its own, so that sort_store only has to merge the chunks
+                df = sort_by_day(clean_flights(chunk, categories))
+                dates = df['FL_DATE']
+                in_order = in_order and (last_day is None or dates.iloc[0] >= last_day)
+                last_day = dates.iloc[-1]
+                table = pa.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False)
+                if writer is None:
+                    writer = _new_writer(sink)
+                writer.write_table(table.replace_schema_metadata(None))
+                if progress is not None:
+                    progress(min(csv_file.tell() / total_bytes, 1.0))
+            if writer is None:
+                raise ValueError(f'{csv_path} contains no flights')
+            writer.close()
+
+        if not in_order:
+            sort_store(tmp, sorted_tmp)
+            os.replace(sorted_tmp, tmp)
+        os.replace(tmp, out_path)
+    finally:
+        # Left behind only by a failed ingest; no other writer uses these names
+        for path in (tmp, sorted_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def store_paths(source, progress=None):
+    """Paths of the typed stores of the partitions of `source`, ingesting each on first use."""
+    manifest = _load_manifest()
+    known = dict(manifest)
+    csv_paths = partition_paths(source)
+    paths = [cache_path(csv_path, partition_digest(csv_path, manifest)) for csv_path in csv_paths]
+    updated = {key: entry for key, entry in manifest.items() if known.get(key) != entry}
+    if updated:
+        # Recorded before ingesting, so that a prune elsewhere keeps the new stores
+        _update_manifest(updated)
+
+    for csv_path, path in zip(csv_paths, paths):
+        if not os.path.exists(path):
+            # Sessions asking at once share one ingest, forgotten once done so
+            # that a deleted store is ingested again; a late caller finds it
+            _ingests.get(path, lambda: os.path.exists(path) or ingest_csv(csv_path, path, progress=progress))
+            _ingests.discard(lambda key: key == path)
+    prune_stores()
+    return paths
+
+
+def read_stores(paths, columns=None):
+    """Memory-map the given stores (optionally only some columns) into one frame.
+
+    Numeric columns of a single store stay read-only views of the mapped file.
+    Every store must have STORE_SCHEMA, so that partitions always concatenate.
+    """
+    tables = [feather.read_table(path, columns=columns, memory_map=True) for path in paths]
+    for path, table in zip(paths, tables):
+        expected = pa.schema([STORE_SCHEMA.field(name) for name in table.schema.names])
+        if not table.schema.equals(expected):
+            raise ValueError(f'{path} does not have the store schema; delete it to ingest it again')
+    return pa.concat_tables(tables).unify_dictionaries().to_pandas(split_blocks=True)
+
+
+def load_flights(source, progress=None):
+    """Return the cleaned flights of all partitions of `source`, ingesting each on first use."""
+    return read_stores(store_paths(source, progress=progress))
@@ -0,0 +1,108 @@
+"""Per-section timing, memory and payload-size instrumentation of a rerun.
+
+Wrap each dashboard section in `Profiler.section(name)` and report the charts
+it draws with `Profiler.add_spec`. When the profiler is enabled every section
+records its wall time, the peak memory it allocated on top of what was live
+when it started (traced with tracemalloc) and the serialized size of its
+Vega-Lite specs. `flush` appends one JSON line per section to the log. A
+disabled profiler does no tracing or serialization at all.
+
+tracemalloc is process-wide, and Streamlit runs sessions in parallel threads.
+Tracing therefore stays on while any section of any profiler is running, and
+the peak is only reset by a section starting alone. A section that overlaps
+another's reports an upper bound that includes the other's allocations.
+
+Enable it with FLIGHTS_PROFILE=1; FLIGHTS_PROFILE_LOG overrides the log path.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from flight_store import CACHE_DIR
+
+PROFILE_ENV = 'FLIGHTS_PROFILE'
+PROFILE_LOG_ENV = 'FLIGHTS_PROFILE_LOG'
+DEFAULT_LOG_PATH = os.path.join(CACHE_DIR, 'profile.jsonl')
+
+
+_tracing_lock = threading.Lock()
+# Sections currently tracing memory, and whether tracing was started for them
+_traced_sections = 0
+_started_tracing = False
+
+
+def _start_tracing():
+    """Count a section in; returns the traced memory at its start."""
+    global _traced_sections, _started_tracing
+    with _tracing_lock:
+        if _traced_sections == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            tracemalloc.reset_peak()
+        _traced_sections += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing(baseline):
+    """Count a section out; returns its peak memory above `baseline`."""
+    global _traced_sections, _started_tracing
+    with _tracing_lock:
+        peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+        _traced_sections -= 1
+        if _traced_sections == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+        return peak
+
+
+def profiling_requested():
+    return os.environ.get(PROFILE_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+class Profiler:
+    def __init__(self, enabled=False, log_path=None, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.log_path = log_path or os.environ.get(PROFILE_LOG_ENV) or DEFAULT_LOG_PATH
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = []
+        self._current = None
+
+    @contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+        baseline = _start_tracing() if self.trace_memory else None
+        record = {'section': name, 'seconds': 0.0, 'peak_bytes': 0, 'spec_bytes': 0, 'charts': 0}
+        outer, self._current = self._current, record
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if baseline is not None:
+                record['peak_bytes'] = _stop_tracing(baseline)
+            self._current = outer
+            self.records.append(record)
+
+    def add_spec(self, spec):
+        """Count a chart spec drawn by the current section."""
+        if self.enabled and self._current is not None:
+            self._current['spec_bytes'] += len(json.dumps(spec, default=str))
+            self._current['charts'] += 1
+
+    def flush(self):
+        """Append this run's records to the JSON-lines log."""
+        if not self.enabled or not self.records:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        timestamp = time.time()
+        with open(self.log_path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps({'run': self.run_id, 'time': timestamp, **record}) + '\n')
@@ -0,0 +1,104 @@
+"""Process-wide memoization of section results, keyed by widget state.
+
+Streamlit reruns the whole script on every widget change. `QueryCache` keeps
+the results computed for each (dataset version, section, widget values) key,
+such as aggregate tables and serialized chart specs, so that a rerun only
+recomputes the sections whose inputs actually changed. Entries are evicted
+least-recently-used first once their total size exceeds the byte budget.
+"""
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def normalize(value):
+    """Hashable, order-independent form of widget values."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def query_key(version, name, widgets):
+    return (version, name, normalize(widgets))
+
+
+def result_size(value):
+    """Approximate size in bytes of a cached result."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        # numpy and Arrow arrays
+        return int(value.nbytes)
+    if isinstance(value, dict) and all(isinstance(v, (pd.DataFrame, pd.Series)) for v in value.values()):
+        # Tables per option, e.g. a status cube
+        return sum(result_size(v) for v in value.values())
+    if isinstance(value, dict):
+        # Chart specs: their serialized size is what they cost
+        return len(json.dumps(value, default=str))
+    if isinstance(value, (list, tuple)):
+        return sum(result_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """LRU cache of computed results with a total byte budget and hit/miss counters."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = result_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, match):
+        """Drop the entries whose key satisfies `match(key)`."""
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
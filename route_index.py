@@ -0,0 +1,89 @@
+"""Sorted route index of the flight counts for the route maps.
+
+`RouteIndex` takes the number of flights per (ORIGIN, DEST, minutes of delay)
+of one delay type, the `route_delays` aggregate, sorts these cells once by
+route and delay, and keeps prefix sums of their flights and delay minutes.
+The cells of every route then occupy one contiguous slice, with their delays
+in order. The count and total delay of each route within any [min, max] delay
+range take two binary searches per route and two prefix-sum lookups. The
+index is bounded by routes x distinct delays, not by flights. The routes are
+also grouped by origin and by destination airport, so per-airport totals are
+segment sums over the route table.
+"""
+import numpy as np
+import pandas as pd
+
+SIDES = ('ORIGIN', 'DEST')
+
+
+def _codes(values):
+    values = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+    return values.cat.codes.to_numpy().astype(np.int64), values.cat.categories
+
+
+def _segments(sorted_values):
+    """Start offsets of the runs of equal values in `sorted_values`."""
+    if not len(sorted_values):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+
+
+class RouteIndex:
+    def __init__(self, counts, delay_type):
+        """`counts` is the route_delay_counts table of `delay_type`."""
+        self.delay_type = delay_type
+        origin, self.origins = _codes(counts['ORIGIN'])
+        dest, self.dests = _codes(counts['DEST'])
+        delay = counts[delay_type].to_numpy().astype(np.int64)
+        flights = counts['count'].to_numpy().astype(np.int64)
+
+        # One sortable key per cell: route, then delay offset within the route
+        self.min_delay = int(delay.min()) if len(delay) else 0
+        self.span = (int(delay.max()) - self.min_delay + 1) if len(delay) else 1
+        route = origin * len(self.dests) + dest
+        keys = route * self.span + (delay - self.min_delay)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.count_prefix = np.r_[0, np.cumsum(flights[order])]
+        self.delay_prefix = np.r_[0, np.cumsum((flights * delay)[order])]
+
+        sorted_routes = route[order]
+        starts = _segments(sorted_routes)
+        self.routes = sorted_routes[starts]
+        self.route_origin = self.routes // len(self.dests)
+        self.route_dest = self.routes % len(self.dests)
+
+        # Routes are origin-major already; a stable permutation groups them by destination
+        self.airport_routes = {}
+        for side, codes in (('ORIGIN', self.route_origin), ('DEST', self.route_dest)):
+            perm = np.argsort(codes, kind='stable')
+            self.airport_routes[side] = (perm, _segments(codes[perm]))
+
+    @property
+    def nbytes(self):
+        arrays = [self.keys, self.count_prefix, self.delay_prefix, self.routes, self.route_origin, self.route_dest]
+        for perm, starts in self.airport_routes.values():
+            arrays += [perm, starts]
+        return sum(a.nbytes for a in arrays)
+
+    def route_totals(self, min_delay, max_delay):
+        """Flight count and delay sum of every route, over flights within [min_delay, max_delay]."""
+        base = self.routes * self.span
+        low = np.clip(min_delay - self.min_delay, 0, self.span)
+        high = np.clip(max_delay - self.min_delay, -1, self.span - 1)
+        lo = np.searchsorted(self.keys, base + low, side='left')
+        hi = np.searchsorted(self.keys, base + high, side='right')
+        hi = np.maximum(hi, lo)
+        return self.count_prefix[hi] - self.count_prefix[lo], self.delay_prefix[hi] - self.delay_prefix[lo]
+
+    def airport_totals(self, side, counts, sums):
+        """Per-airport sums of route `counts` and `sums`, airports of `side` as codes."""
+        perm, starts = self.airport_routes[side]
+        codes = (self.route_origin if side == 'ORIGIN' else self.route_dest)[perm][starts]
+        if not len(perm):
+            return codes, counts[:0], sums[:0]
+        return codes, np.add.reduceat(counts[perm], starts), np.add.reduceat(sums[perm], starts)
+
+    def airports(self, side, codes):
+        categories = self.origins if side == 'ORIGIN' else self.dests
+        return pd.Categorical.from_codes(codes, categories=categories)
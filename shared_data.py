@@ -0,0 +1,80 @@
+"""Process-wide, single-flight cache of the datasets shared by every session.
+
+Streamlit re-executes the app script for each session and rerun, but imported
+modules live once per process. Loaders decorated with `single_flight` keep
+their results here, keyed by their arguments, so every session reads the
+same objects. When several sessions ask for a result that isn't there yet,
+the first one computes it and the others wait on its Future instead of
+computing their own copies. `prefetch` starts a fill in the background and
+returns that Future, so independent loads can overlap.
+"""
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+PREFETCH_WORKERS = 4
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def get(self, key, compute):
+        """The result for `key`, computed by `compute()` only if no other call is doing so."""
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                # Wake the waiters first, whatever happens to the key
+                future.set_exception(e)
+                # Let a later call retry rather than cache the failure, unless
+                # discard() already dropped it and another fill took its place
+                with self._lock:
+                    if self._futures.get(key) is future:
+                        del self._futures[key]
+        return future.result()
+
+    def done(self, match):
+        """{key: result} of the successful fills whose key satisfies `match(key)`."""
+        with self._lock:
+            futures = {key: future for key, future in self._futures.items() if match(key) and future.done()}
+        return {key: future.result() for key, future in futures.items() if future.exception() is None}
+
+    def discard(self, match):
+        """Forget the results whose key satisfies `match(key)`."""
+        with self._lock:
+            for key in [key for key in self._futures if match(key)]:
+                del self._futures[key]
+
+
+_results = SingleFlight()
+_prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+
+
+def single_flight(func):
+    """Memoize `func` process-wide by its (hashable) positional arguments.
+
+    The results are shared, not copied, so callers must treat them as read-only.
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        return _results.get((func.__qualname__, args), lambda: func(*args))
+
+    wrapper.prefetch = lambda *args: _prefetcher.submit(wrapper, *args)
+    return wrapper
+
+
+def results(match):
+    """{(function name, arguments): result} of the shared results that satisfy `match`."""
+    return _results.done(lambda key: match(*key))
+
+
+def discard(match):
+    """Forget the shared results whose (function name, arguments) satisfy `match`."""
+    _results.discard(lambda key: match(*key))
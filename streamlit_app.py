@@ -1,48 +1,204 @@
+import os
+
+import altair as alt
 import streamlit as st
 import pandas as pd
-import altair as alt
+
+import charts
+from aggregates import AGGREGATES, build_aggregates, extend_aggregates
+from basemap import load_basemap, project_airports
+from day_index import DayIndex
+from flight_data import (
+    SAMPLE_PER_CARRIER, STATUS_LABELS, STATUS_OPTIONS, airport_index, carrier_sample, on_time_from_status,
+    period_status_counts, route_delay_counts, sort_by_day, status_cube,
+)
+from flight_store import read_stores, store_paths
+from profiling import Profiler, profiling_requested
+from query_cache import QueryCache, query_key
+from route_index import RouteIndex
+from shared_data import discard, results, single_flight
+from table_view import PAGE_SIZES, matching_rows, open_table, page, row_count
 
 # st.beta_set_page_config(layout="wide")
 
+# Altair refuses to embed more than 5,000 rows, a guard against charting raw
+# frames. Every chart here embeds bounded data instead (aggregates, one row per
+# route, the per-carrier sample), but on full-year data some exceed that count.
+alt.data_transformers.disable_max_rows()
+
 st.title("Why is Your Flight Delayed?")
 st.text("Interactive Data Science Assignment 3, by Yeju Zhou & Xuanyi Li")
 
 st.write("Explore how flights delay in the United States and possible reasons that lead to the delays. ")
 
-@st.cache  # add caching so we load the data only once
-def load_data(url):
-    df = pd.read_csv(url)
-    return df
-
-df = load_data('./2018-5k.csv')
-df = df.drop('Unnamed: 27', 1)
-df = df.drop('Unnamed: 0', 1)
-df = df.fillna(0)
+def ingest_partitions(url):
+    # Runs on every rerun, but only hashes and ingests partitions it hasn't seen
+    bars = []
+    def progress(fraction):
+        if not bars:
+            bars.append(st.progress(0.0))
+        bars[0].progress(fraction)
+    paths = store_paths(url, progress=progress)
+    for bar in bars:
+        bar.empty()
+    return tuple(paths)
+
+@single_flight  # add caching so we load the data only once, for every session
+def load_data(paths):
+    # Streamed, typed, labelled and ordered by day once per partition, then
+    # memory-mapped read-only. Only partitions whose dates overlap get sorted here
+    return sort_by_day(read_stores(paths))
+
+@single_flight
+def load_day_index(paths):
+    # Row offset and prefix sums of every day from the merged daily aggregates, see day_index.py
+    aggregates = load_aggregates(paths)
+    return DayIndex(aggregates['daily_status'], aggregates['daily_delays'])
+
+@single_flight
+def load_table(paths):
+    # The same memory-mapped stores as Arrow, for paging through the raw rows
+    return open_table(paths)
+
+@single_flight
+def load_aggregates(paths):
+    # Built once per partition across a process pool and merged, see aggregates.py;
+    # when partitions were only added, just theirs are merged into the former ones
+    for (_, (former_paths,)), former in results(lambda name, args: name == 'load_aggregates').items():
+        if set(former_paths) < set(paths):
+            return extend_aggregates(former, [path for path in paths if path not in former_paths])
+    return build_aggregates(paths)
+
+@single_flight
+def load_airport_index(paths, path):
+    # Read once, and only the airports the flights' routes actually use
+    index = airport_index(pd.read_csv(path), load_aggregates(paths)['route_delays']['ARR_DELAY'])
+    if load_basemap() is not None:
+        index = project_airports(index)
+    return index
+
+@single_flight
+def load_route_index(paths, delay_type):
+    # From the merged per-route delay counts; delay range changes then only binary-search it
+    return RouteIndex(load_aggregates(paths)['route_delays'][delay_type], delay_type)
+
+@st.cache(allow_output_mutation=True)
+def load_query_cache():
+    # One cache per process, shared by every session and rerun
+    return QueryCache(QUERY_CACHE_BYTES)
+
+def show_chart(name, build, **widgets):
+    # Rebuild the chart spec only when the data or the section's widgets change
+    key = query_key(DATASET_VERSION, name, dict(widgets, dates=DATES))
+    spec = query_cache.get_or_compute(key, lambda: build().to_dict())
+    profiler.add_spec(spec)
+    st.vega_lite_chart(spec)
+
+def for_dates(name, whole, window, **widgets):
+    # The shared result over every flight, or the selected dates' result, cached per range
+    if ALL_DATES:
+        return whole()
+    return query_cache.get_or_compute(query_key(DATASET_VERSION, name, dict(widgets, dates=DATES)), window)
+
+def window_aggregate(name):
+    # Totals and per-day breakdowns come from the day index in O(days); the rest
+    # is built from the rows of the selected dates only
+    if name == 'overview':
+        return on_time_from_status(day_index.status_totals(*DATES))
+    if name == 'daily_delays':
+        return day_index.daily_delays(*DATES)
+    if name == 'status_cube':
+        daily_status = day_index.daily_status(*DATES)
+        cube = {option: period_status_counts(daily_status, option) for option in ['MONTH', 'DATE']}
+        cube.update(status_cube(df, ['CARRIER', 'ORIGIN', 'DEST']))
+        return cube
+    return AGGREGATES[name][0](df)
+
+def aggregate(name):
+    return for_dates(f'aggregate:{name}', lambda: aggregates[name], lambda: window_aggregate(name))
+
+# A CSV, or a directory of CSV partitions that new days of flights are added to
+DATA_URL = './2018-5k.csv'
+QUERY_CACHE_BYTES = 256 * 1024 * 1024
+# Per-section time, memory and spec sizes of this rerun, see profiling.py
+profiler = Profiler(st.sidebar.checkbox("Profile sections", value=profiling_requested()))
+with profiler.section('load_data'):
+    STORE_PATHS = ingest_partitions(DATA_URL)
+    # Stop holding on to what was loaded for superseded partitions, except the
+    # aggregates, which the new ones may be merged from
+    discard(lambda name, args: args[0] != STORE_PATHS and name != 'load_aggregates')
+    # Build (or load) the aggregates while the flights are mapped
+    pending_aggregates = load_aggregates.prefetch(STORE_PATHS)
+    all_flights = load_data(STORE_PATHS)
+with profiler.section('load_aggregates'):
+    aggregates = pending_aggregates.result()
+    discard(lambda name, args: args[0] != STORE_PATHS)
+    day_index = load_day_index(STORE_PATHS)
+
+# Date range every section below is filtered to
+first_day, last_day = day_index.first_day.date(), day_index.last_day.date()
+dates = st.sidebar.date_input("Flight dates", value=(first_day, last_day),
+                              min_value=first_day, max_value=last_day)
+# While the second date is being picked only one is selected
+DATES = (dates[0], dates[-1]) if isinstance(dates, (list, tuple)) else (dates, dates)
+ALL_DATES = DATES == (first_day, last_day)
+# A zero-copy slice of the day-sorted flights
+df = all_flights.iloc[day_index.rows(*DATES)]
+status_totals = day_index.status_totals(*DATES)
+st.sidebar.write(f"{status_totals.sum():,} flights, "
+                 f"{status_totals.sum() - status_totals['on time']:,} of them not on time")
+# The store names carry the partitions' content hashes and the store version
+DATASET_VERSION = tuple(os.path.basename(path) for path in STORE_PATHS)
+query_cache = load_query_cache()
+# Charts of a superseded dataset can't be hit again once a partition is appended
+query_cache.invalidate(lambda key: key[0] != DATASET_VERSION)
 carrier_names = df.OP_CARRIER.unique().tolist()
 airport_names = df.ORIGIN.unique().tolist()
 
-# init STATUS col 
-df.loc[df['ARR_DELAY'] <= 0, 'STATUS'] = 'on time'
-df.loc[df['ARR_DELAY'] > 0, 'STATUS'] = 'slightly delayed'
-df.loc[df['ARR_DELAY'] >= 30, 'STATUS'] = 'delayed'
-df.loc[df['DIVERTED'] == 1, 'STATUS'] = 'diverted'
-df.loc[df['CANCELLED'] == 1, 'STATUS'] = 'cancelled'
-
-df.loc[df['ARR_DELAY'] <= 0, 'ON_TIME?'] = 'On Time'
-df.loc[df['ARR_DELAY'] > 0, 'ON_TIME?'] = 'Delayed'
-df.loc[df['DIVERTED'] == 1, 'ON_TIME?'] = 'Delayed'
-df.loc[df['CANCELLED'] == 1, 'ON_TIME?'] = 'Delayed'
 
 
-
-def show_data(df):
+def show_raw_table(table):
+    # Only the current page of rows is ever sent to the browser
+    row1_1, row1_2, row1_3, row1_4 = st.beta_columns(4)
+    with row1_1:
+        carriers = st.multiselect("Carrier", sorted(carrier_names))
+    with row1_2:
+        origins = st.multiselect("Origin", sorted(airport_names))
+    with row1_3:
+        dests = st.multiselect("Destination", sorted(airport_names))
+    with row1_4:
+        statuses = st.multiselect("Status", STATUS_LABELS)
+
+    row2_1, row2_2, row2_3, row2_4 = st.beta_columns(4)
+    with row2_1:
+        sort_by = st.selectbox("Sort by", ['(file order)'] + table.column_names)
+        sort_by = None if sort_by == '(file order)' else sort_by
+    with row2_2:
+        descending = st.checkbox("Descending")
+    with row2_3:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES)
+
+    view = dict(carriers=carriers, origins=origins, dests=dests, statuses=statuses,
+                dates=None if ALL_DATES else DATES, sort_by=sort_by, descending=descending)
+    rows = query_cache.get_or_compute(query_key(DATASET_VERSION, 'raw_rows', view),
+                                      lambda: matching_rows(table, **view))
+    total = row_count(table, rows)
+    pages = max((total + page_size - 1) // page_size, 1)
+    with row2_4:
+        page_number = st.number_input("Page", min_value=1, max_value=pages, value=1)
+
+    offset = (page_number - 1) * page_size
+    st.write(f"Rows {min(offset + 1, total):,}-{min(offset + page_size, total):,} of {total:,}")
+    st.dataframe(page(table, rows, offset, page_size).to_pandas())
+
+def show_data(table):
     st.header('Flight Dataset')
 
     st.write("In this project, we randomly select 5K rows from the flight dataset in 2018. ")
     st.write("This dataset contains....")
     if st.checkbox("Show Raw Data"):
         st.write("Let's look at raw data in the Data Frame.")
-        st.write(df)
+        show_raw_table(table)
     if st.checkbox("Show Column Information"):
         st.write("Let's look at columns in the Data Frame.")
         st.markdown("**FL_DATE**: date of flight (yyyy-mm-dd)")
@@ -73,7 +229,8 @@ def show_data(df):
         st.markdown("**SECURITY_DELAY**: security delay (minutes). This is caused by security reason.")
         st.markdown("**LATE_AIRCRAFT_DELAY**: late aircraft delay (minutes). This is due to the late arrival of the same aircraft at a previous airport.")
     
-show_data(df)
+with profiler.section('show_data'):
+    show_data(load_table(STORE_PATHS))
 
 
 # Overview of delay & cancellation
@@ -81,26 +238,13 @@ st.header('Overview of Delay & Cancalation')
 
 def delay_per():
     st.subheader('How many flights are delayed, diverted or cancelled among the 5K flights?')
-    delay_per = alt.Chart(df).mark_bar().encode(
-        x = alt.X('count(ON_TIME?):Q', title = 'Number of Flights'),
-        y = alt.Y('ON_TIME?:O', title = ''),
-        color = alt.Color('ON_TIME?', legend = None),
-    ).properties(width = 600, height = 160)
+    show_chart('delay_per', lambda: charts.delay_overview(aggregate('overview')))
 
-    text = delay_per.mark_text(
-        align = 'left',
-        baseline = 'middle',
-        dx = 3  # Nudges text to right so it doesn't appear on top of the bar
-    ).encode(
-        text = 'count(ON_TIME?):Q'
-    )
+with profiler.section('delay_per'):
+    delay_per()
 
-    delay_per + text
 
-delay_per()
-
-
-def delay_distribution(df):
+def delay_distribution(pairs):
     st.subheader('Delay time distribution')
 
     """
@@ -119,37 +263,11 @@ def delay_distribution(df):
     "**Let's see how each of these delays distribute. Is there any relationship among different delay types?**"
     "You can select a range of delay on one graph to see distribution of delay for other types."
 
-    brush = alt.selection_interval(encodings=['x'])
-    delay_names = ['ARR_DELAY','DEP_DELAY','CARRIER_DELAY','WEATHER_DELAY', 'NAS_DELAY', 'SECURITY_DELAY', 'LATE_AIRCRAFT_DELAY']
-    hist = (
-        alt.Chart().mark_bar().encode(
-            alt.X(
-                alt.repeat("row"),
-                type="quantitative",
-                axis=alt.Axis(
-                    format='d', titleAnchor='start'
-                ),
-            ),
-            alt.Y('count():Q', title=None, scale=alt.Scale(type='log')),
-            tooltip=['count():Q']
-        )
-    )
-    st.write(alt.layer(
-        hist.add_selection(brush).encode(color=alt.value('lightgrey')),
-        hist.transform_filter(brush),
-    ).properties(width=600, height=100).repeat(
-        row=delay_names,
-        data=df
-    ).transform_calculate(
-        ARR_DELAY='datum.ARR_DELAY <300 ? datum.ARR_DELAY : 300',
-        DEP_DELAY='datum.DEP_DELAY <300 ? datum.DEP_DELAY : 300'
-
-    ).configure_view(
-        stroke='transparent'
-    ))
-
-
-delay_distribution(df)
+    show_chart('delay_distribution', lambda: charts.delay_distribution(pairs))
+
+
+with profiler.section('delay_distribution'):
+    delay_distribution(aggregate('delay_bins'))
 
 
 st.header("What factors delay your flight?")
@@ -164,43 +282,13 @@ st.subheader('\n What affects the delay status of a flight?')
 def status_by_option():
     option = st.selectbox(
         'Flight Status by ?',
-         ['MONTH', 'DATE', 'CARRIER', 'ORIGIN', 'DEST'])
-
-    if option == 'MONTH':
-        x = 'month(FL_DATE):O'
-        l = 12
-    elif option == 'DATE':
-        x = 'date(FL_DATE):O'
-    elif option == 'CARRIER':
-        x = 'OP_CARRIER:O'
-        l = len(df['OP_CARRIER'].unique())
-    elif option == 'ORIGIN':
-        x = 'ORIGIN:O'
-        l = len(df['ORIGIN'].unique())
-    elif option == 'DEST':
-        x = 'DEST:O'
-        l = len(df['DEST'].unique())
-
-    if option == 'MONTH' or option == 'DATE':
-
-        status_by_option = alt.Chart(df).mark_bar().transform_filter(alt.datum['STATUS'] != 'on time').encode(
-            x = alt.X(x, title = option),
-            y = alt.Y('count()', title = 'Count Delayed Flights'),
-            color = 'STATUS',
-            tooltip = [alt.Tooltip(x, title = option), alt.Tooltip('count()', title = 'Count Delayed Flights')],
-        ).properties(width = 800, height = 400).interactive()
-
-    else:
-        status_by_option = alt.Chart(df).mark_bar().transform_filter(alt.datum['STATUS'] != 'on time').encode(
-            x = alt.X(x, axis = alt.Axis(labelOverlap = True), sort = '-y', title = option),
-            y = alt.Y('count()', title = 'Count Delayed Flights'),
-            color = 'STATUS',
-            tooltip = [alt.Tooltip(x, title = option), alt.Tooltip('count()', title = 'Count Delayed Flights')],
-        ).properties(width = 800, height = 400).interactive()
+         STATUS_OPTIONS)
 
-    status_by_option
+    show_chart('status_by_option', lambda: charts.status_by_option(aggregate('status_cube'), option),
+               option=option)
 
-status_by_option()
+with profiler.section('status_by_option'):
+    status_by_option()
 
 'It is noteworthy that different carriers have drastically different performance on flight delays.'
 'Carrier WN flew almost twice the number of delayed flights than any other carrier!' 
@@ -241,14 +329,8 @@ def plot_map(df, collect_from='ORIGIN', connect_to='DEST'):
 
     # airports = data.airports()
     # states = alt.topo_feature(data.us_10m.url, feature="states")
-    airports = pd.read_csv('airport.csv')
-    states = alt.topo_feature('https://vega.github.io/vega-datasets/data/us-10m.json', feature='states')
-
+    airports = load_airport_index(STORE_PATHS, 'airport.csv')
 
-    # Create mouseover selection
-    select_city = alt.selection_single(
-        on="mouseover", fields=[collect_from], empty="none"
-    )
     row1_1, row1_2, _, row1_3 = st.beta_columns((5,5,1,5))
     with row1_1:
         min_value_delay = st.slider("Select minimun value of delay", -100, 1000, -100, key=collect_from)
@@ -257,87 +339,27 @@ def plot_map(df, collect_from='ORIGIN', connect_to='DEST'):
     with row1_3:
         delay_type = show_delay_type_selection(collect_from)
 
-    # Define which attributes to lookup from airports.csv
-    lookup_data = alt.LookupData(
-        airports, key="iata", fields=["state", "latitude", "longitude"]
-    )
-
-    background = alt.Chart(states).mark_geoshape(
-        fill="lightgray",
-        stroke="white"
-    ).properties(
-        width=650,
-        height=400
-    ).project("albersUsa")
-
-    scale = alt.Scale(
-        range=['green', 'orange', 'darkred'],
-        domain=(0,60)
-    )
-
-    connections = alt.Chart(df).mark_rule(opacity=0.35).transform_filter(
-        (alt.datum[f'{delay_type}']>= min_value_delay) &
-        (alt.datum[f'{delay_type}']<= max_value_delay)
-    ).encode(
-        latitude="latitude:Q",
-        longitude="longitude:Q",
-        latitude2="lat2:Q",
-        longitude2="lon2:Q",
-        color=alt.Color("delay:Q", scale=scale),
-        size=alt.Size("count:Q",scale=alt.Scale(range=[0, 40], domain=(0, 20),type='linear'), legend=None),
-        tooltip=['ORIGIN:N', 'DEST:N', 'count:Q', 'delay:Q']
-    ).transform_aggregate(
-        count=f"count({delay_type})",
-        delay=f"average({delay_type})",
-        groupby=["ORIGIN","DEST"]
-    ).transform_lookup(
-        lookup=collect_from,
-        from_=lookup_data
-    ).transform_lookup(
-        lookup=connect_to,
-        from_=lookup_data,
-        as_=["state", "lat2", "lon2"]
-    ).transform_filter(
-        select_city 
-    )
-
-    points = alt.Chart(df).mark_circle().transform_filter(
-        (alt.datum[delay_type]>= min_value_delay) &
-        (alt.datum[delay_type]<= max_value_delay)
-    ).encode(
-        latitude="latitude:Q",
-        longitude="longitude:Q",
-        size=alt.Size("routes:Q", scale=alt.Scale(range=[0, 1000]), legend=None),
-        order=alt.Order("routes:Q", sort="descending"),
-        color=alt.Color("average_delay:Q", scale=scale),
-        tooltip=[f"{collect_from}:N", "average_delay:Q"]
-    ).transform_aggregate(
-        average_delay=f"average({delay_type})",
-        routes=f"count({connect_to})",
-        groupby=[collect_from]
-    ).transform_lookup(
-        lookup=collect_from,
-        from_=lookup_data
-    ).transform_filter(
-        (alt.datum[collect_from] != 'SJU') & (alt.datum[collect_from] != 'GUM') &
-        (alt.datum[collect_from] != 'AZA') & (alt.datum[collect_from] != 'PBG') &
-        (alt.datum[collect_from] != 'USA') & (alt.datum[collect_from] != 'ECP') &
-        (alt.datum[collect_from] != 'STT')
-    ).add_selection(
-        select_city
-    )
     st.write("You can select each airport and see the distribution of delays from/to this airport.")
     st.write("Thickness represents the throughput. Color represents the lateness.")
 
-    st.write((background + connections + points).configure_view(stroke=None))
+    routes = for_dates('route_index', lambda: load_route_index(STORE_PATHS, delay_type),
+                       lambda: RouteIndex(route_delay_counts(df, [delay_type])[delay_type], delay_type),
+                       delay_type=delay_type)
+    show_chart('plot_map', lambda: charts.route_map(routes, airports, load_basemap(),
+                                                    min_value_delay, max_value_delay,
+                                                    collect_from, connect_to),
+               collect_from=collect_from, delay_type=delay_type,
+               min_delay=min_value_delay, max_delay=max_value_delay)
 
 st.header("Is geographical position related to the flight delays?")
 # row1_1, row1_2 = st.beta_columns((1,1))
 # with row1_1:
-plot_map(df)
+with profiler.section('plot_map ORIGIN'):
+    plot_map(df)
 
 # with row1_2:
-plot_map(df, 'DEST', 'ORIGIN')
+with profiler.section('plot_map DEST'):
+    plot_map(df, 'DEST', 'ORIGIN')
 
 
 # delay composition
@@ -351,35 +373,8 @@ def carrier_delay():
 
     """
 
-    carrier_delay = alt.Chart(df).mark_bar().transform_filter(
-        alt.datum['CARRIER_DELAY']>0
-    ).encode(
-        x=alt.X("OP_CARRIER", sort='-y', title = 'Carrier'),
-        y=alt.Y("average(CARRIER_DELAY)", scale=alt.Scale(zero=False), title = 'Average Carrier Delay'),
-        tooltip=[alt.Tooltip("OP_CARRIER", title = 'Carrier'), alt.Tooltip("average(CARRIER_DELAY)", title = 'Average Carrier Delay')]
-    ).properties(
-        width=600, height=250
-    )
-    st.write(carrier_delay)
-
-    picked = alt.selection_interval()
-
-    carrier_delay_dist = alt.Chart(df).mark_point().transform_filter(
-        alt.datum['CARRIER_DELAY']>0
-    ).transform_calculate(    
-        CARRIER_DELAY="datum.CARRIER_DELAY < 350 ? datum.CARRIER_DELAY : 350", 
-    ).encode(
-        x=alt.X("OP_CARRIER"),
-        y=alt.Y("CARRIER_DELAY", scale=alt.Scale(zero=False)),
-        order=alt.Order(
-            'average(CARRIER_DELAY)',
-            sort='descending'),
-        tooltip=['OP_CARRIER', 'CARRIER_DELAY', 'ARR_DELAY']
-    ).properties(
-        width=600, height=100
-    ).add_selection(picked) 
+    show_chart('carrier_delay', lambda: charts.carrier_delay_bars(aggregate('carrier_delay')))
 
-    
     # st.write()
 
     # st.write(carrier_delay_dist.add_selection(picked) & carrier_delay.transform_filter(picked))
@@ -389,33 +384,23 @@ def carrier_delay():
 
     ## carrier delay vs. arrival delay
     "**Is there any relationship between Carrier Delay and other type delays?**"
-    select = alt.selection_single(on='mouseover', fields=['OP_CARRIER'])
-
     delay_type_input = st.selectbox("Show correlation between Carrier Delay and ",('Arrival Delay', 'Departure Delay',
        'Weather Delay', 'Nas Delay', 'Security Delay', 'Late Aircraft Delay'))
     delay_type = get_delay_type(delay_type_input)
 
-    carrier_vs_arr = alt.Chart(df).mark_point().transform_filter(
-        alt.datum['CARRIER_DELAY']>=0
-    ).transform_calculate(    
-        SELECTED_DELAY=f"datum.{delay_type} < 350 ? datum.{delay_type} : 350",  
-        CARRIER_DELAY="datum.CARRIER_DELAY < 350 ? datum.CARRIER_DELAY : 350", 
-    ).encode(
-        x='SELECTED_DELAY:Q',
-        y=alt.Y("CARRIER_DELAY"),
-        color=alt.Color('OP_CARRIER'),
-        tooltip=[delay_type, 'CARRIER_DELAY','OP_CARRIER']
-    ).properties(
-        width=600, height=300
-    )
     """
     You can select the interval in the graph below to explore the carrier delays in a specific range.
     """
-    st.write(carrier_delay_dist & carrier_vs_arr.transform_filter(picked).encode(
-        color=alt.condition(select, "OP_CARRIER:N", alt.value('lightgray'))
-    ).add_selection(select))
+    # The same flights for every delay type and rerun, merged from the partitions' samples
+    sample = for_dates('carrier_sample', lambda: aggregates['carrier_sample'], lambda: carrier_sample(df))
+    delayed = aggregate('carrier_delay')['count'].sum()
+    st.write(f"Each carrier shows at most {SAMPLE_PER_CARRIER:,} randomly sampled flights with a carrier delay "
+             f"({len(sample):,} of {delayed:,} such flights).")
+    show_chart('carrier_delay_points', lambda: charts.carrier_delay_points(sample, delay_type),
+               delay_type=delay_type)
 
-carrier_delay()
+with profiler.section('carrier_delay'):
+    carrier_delay()
 
 
 st.header("Now let's see how the departure & arrival time relate to flight delays.")
@@ -423,76 +408,10 @@ st.header("Now let's see how the departure & arrival time relate to flight delay
 '\n Drag you mouse to select an area and see how the delay status distribute over that time interval! You can also click the colored dots on the legend to see the distribution of one particular status.'
 
 def status_by_dep_arr():
-    selection = alt.selection_multi(fields = ['STATUS'])
-    brush = alt.selection(type='interval')
-
-    color_select_brush = alt.condition(selection | brush,
-                          alt.Color('STATUS:N', legend = None),
-                          alt.value('lightgrey'))
-
-    color_select = alt.condition(selection,
-                          alt.Color('STATUS:N', legend = None),
-                          alt.value('lightgrey'))
-
-    # color_brush = alt.condition(brush,
-    #                       alt.Color('STATUS:N', legend = None),
-    #                       alt.value('lightgray'))
-
-    dep_arr = alt.Chart(df).mark_circle().encode(
-    # dep_arr = alt.Chart(df).mark_circle().transform_filter(alt.datum['STATUS'] != 'on time').encode(
-        x = alt.X('CRS_DEP_TIME:Q', title = 'Departure Time', axis = alt.Axis(labelOverlap = True)),
-        y = alt.Y('CRS_ARR_TIME:Q', title = 'Arrival Time', axis = alt.Axis(labelOverlap = True), sort = '-y'),
-        # color = alt.condition(brush, 'STATUS', alt.value('lightgray')),
-        color = color_select_brush,
-        size = alt.Size('average(ARR_DELAY):Q', title = 'Arrival Delay', scale = alt.Scale(domain = [1, 800]), legend = None),
-        tooltip = [alt.Tooltip('CRS_DEP_TIME', title = 'Departure Time'), alt.Tooltip('CRS_ARR_TIME', title = 'Arrival Time'), \
-        alt.Tooltip('average(ARR_DELAY):Q', title = 'Arrival Delay')],
-    ).add_selection(brush).properties(width = 600, height = 400)
-
-    bars = alt.Chart(df).mark_bar().encode(
-    # bars = alt.Chart(df).mark_bar().transform_filter(alt.datum['STATUS'] != 'on time').encode(
-        y = alt.Y('STATUS', title = ''),
-        # color = 'STATUS',
-        color = color_select,
-        x = alt.X('count(STATUS):Q', title = 'Delayed Flights Count'),
-    ).transform_filter(
-        brush
-    )
-
-    bar_text = bars.mark_text(
-        align = 'left',
-        baseline = 'middle',
-        dx = 3  # Nudges text to right so it doesn't appear on top of the bar
-    ).encode(
-        text = 'count(STATUS):Q'
-    )
-
-    # count = alt.Chart(df).mark_bar().encode(
-    count = alt.Chart(df).mark_bar().transform_filter(alt.datum['STATUS'] != 'on time').encode(
-        x = alt.X('count(STATUS):Q', title = 'Total Delayed Flights Count'),
-    ).transform_filter(
-        brush
-    )
-
-    count_text = count.mark_text(
-        align = 'left',
-        baseline = 'middle',
-        dx = 3 
-    ).encode(
-        text = 'count(STATUS):Q'
-    )
-
-    legend = alt.Chart(df).mark_point().encode(
-    # legend = alt.Chart(df).mark_point().transform_filter(alt.datum['STATUS'] != 'on time').encode(
-        y = alt.Y('STATUS:N', axis = alt.Axis(orient = 'right')),
-        color = color_select
-    ).add_selection(
-        selection
-    )
-
-    (dep_arr & (count + count_text) & (bars + bar_text) ) | legend
-
-status_by_dep_arr()
+    show_chart('status_by_dep_arr', lambda: charts.status_by_dep_arr(df, aggregate('dep_arr_cells')))
+
+with profiler.section('status_by_dep_arr'):
+    status_by_dep_arr()
 
 'If you investigate carefully, you will find that there are much more delayed flights in the upper-right corner, where flights departure late or arrive late.'
 
@@ -502,35 +421,31 @@ def delay_by_month_date():
     st.header('Are there more delays in particular months or dates as the seasons change?')
 
     option = st.selectbox('Month or Date?', ['Month', 'Date'])
-    if option == 'Month':
-        x = 'month(FL_DATE):O'
-    elif option == 'Date':
-        x = 'date(FL_DATE):O'
-
-    delays = pd.melt(df[['FL_DATE', 'CARRIER_DELAY', 'WEATHER_DELAY', 'NAS_DELAY', 'SECURITY_DELAY', 'LATE_AIRCRAFT_DELAY']], id_vars = 'FL_DATE', var_name = 'delay_type', value_name = 'delay')
-
-    all_delay = alt.Chart(delays).mark_area().encode(
-        x = alt.X(x, title = option),
-        y = alt.Y('sum(delay)', title = 'Delay'),
-        color = 'delay_type',
-    ).properties(width = 600, height = 400).interactive()
-
-    all_delay
+    show_chart('delay_by_month_date', lambda: charts.delay_by_month_date(aggregate('daily_delays'), option),
+               option=option)
     
     if option == 'Month':
     	st.write("It makes sense that there are more extreme weathers during July-August (heavy rains) and Nov. (heavy snows)!")
         
-delay_by_month_date()
+with profiler.section('delay_by_month_date'):
+    delay_by_month_date()
 
 
 st.subheader('Will the flying distance also affect the flight delays?')
 'It appears that the shorter the distance, the larger the late aircraft delay! Maybe this is caused by the fact that more flights are flying shorter distances, and the more flights, the more congestion.'
 
 def late_aircraft_delay_by_distance():
-    chart = alt.Chart(df).mark_point().encode(
-        x = 'DISTANCE',
-        y = 'LATE_AIRCRAFT_DELAY',
-    ).properties(width = 600, height = 400)
-    chart
+    show_chart('late_aircraft_delay_by_distance',
+               lambda: charts.late_aircraft_delay_by_distance(df, aggregate('distance_delay_cells')))
+
+with profiler.section('late_aircraft_delay_by_distance'):
+    late_aircraft_delay_by_distance()
+
+
+if st.sidebar.checkbox("Show query cache stats"):
+    st.sidebar.write(query_cache.stats())
 
-late_aircraft_delay_by_distance()
+if profiler.enabled:
+    profiler.flush()
+    st.sidebar.subheader("Section profile")
+    st.sidebar.write(pd.DataFrame(profiler.records).set_index('section'))
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""Paged, server-side view of the raw flights for the "Show Raw Data" table.
+
+`open_table` memory-maps the typed stores as one Arrow table without copying
+them. `matching_rows` filters by date, carrier, airport and status and sorts by any
+column, in Arrow, giving just the positions of the matching rows. `page` then
+cuts one window of rows out: a zero-copy slice when the table is neither
+filtered nor sorted, and a take of only the window's rows otherwise. A page
+costs the same whatever the size of the dataset.
+"""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+PAGE_SIZES = [25, 50, 100, 250]
+# Column filters of the view -> store column
+FILTER_COLUMNS = {'carriers': 'OP_CARRIER', 'origins': 'ORIGIN', 'dests': 'DEST', 'statuses': 'STATUS'}
+
+
+def open_table(paths):
+    """The stores at `paths` as one memory-mapped table; the chunks are not concatenated."""
+    return pa.concat_tables([feather.read_table(path, memory_map=True) for path in paths])
+
+
+def _values(column):
+    if pa.types.is_dictionary(column.type):
+        # Dictionaries can't be sorted on directly; decode just this column
+        return pc.cast(column, column.type.value_type)
+    return column
+
+
+def _date_mask(table, dates):
+    column = table['FL_DATE']
+    start, end = (pa.scalar(pd.Timestamp(date), type=column.type) for date in dates)
+    return pc.and_(pc.greater_equal(column, start), pc.less_equal(column, end))
+
+
+def matching_rows(table, sort_by=None, descending=False, dates=None, **filters):
+    """Positions of the rows matching every non-empty filter of FILTER_COLUMNS, in sort order.
+
+    `dates` is an optional (first, last) range of FL_DATE, both included. None
+    when no filter or sort applies, i.e. when the view is the table as is.
+    """
+    mask = None if dates is None else _date_mask(table, dates)
+    for name, values in filters.items():
+        if values:
+            matches = pc.is_in(table[FILTER_COLUMNS[name]], value_set=pa.array(list(values)))
+            mask = matches if mask is None else pc.and_(mask, matches)
+    if mask is None and sort_by is None:
+        return None
+
+    if sort_by is None:
+        return pc.indices_nonzero(mask)
+    column = table[sort_by]
+    if mask is not None:
+        rows = pc.indices_nonzero(mask)
+        column = column.take(rows)
+    order = pc.sort_indices(pa.table({'key': _values(column)}),
+                            sort_keys=[('key', 'descending' if descending else 'ascending')])
+    return order if mask is None else rows.take(order)
+
+
+def row_count(table, rows):
+    return table.num_rows if rows is None else len(rows)
+
+
+def page(table, rows, offset, size):
+    """Rows [offset, offset + size) of the view given by `rows` (see matching_rows)."""
+    if rows is None:
+        return table.slice(offset, size)
+    return table.take(rows.slice(offset, size))